@@ -0,0 +1,51 @@
+"""
+Measures the time autogui needs to render a state tree with 10k nodes.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import imviz as viz
+
+
+class State:
+
+    def __init__(self):
+
+        self.values = {}
+
+        for i in range(2500):
+            self.values[f"index_{i}"] = i
+            self.values[f"value_{i}"] = float(i)
+            self.values[f"label_{i}"] = f"node {i}"
+            self.values[f"enabled_{i}"] = i % 2 == 0
+
+
+def main():
+
+    state = State()
+
+    frame_times = []
+
+    while len(frame_times) < 300:
+
+        if not viz.wait(vsync=False):
+            sys.exit()
+
+        if viz.begin_window("Benchmark"):
+            start = time.perf_counter()
+            # without a name all 10k values are rendered at top level
+            viz.autogui(state.values)
+            frame_times.append(time.perf_counter() - start)
+        viz.end_window()
+
+    frame_times = np.array(frame_times[10:]) * 1000.0
+
+    print(f"autogui: {np.mean(frame_times):.2f} ms mean, "
+          + f"{np.percentile(frame_times, 95):.2f} ms p95 per frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measures the overhead of viz.statics per call.
+"""
+
+import time
+
+import imviz as viz
+
+
+def widget():
+
+    sts = viz.statics(counter=0, name="widget", values=[])
+    sts.counter += 1
+
+
+def baseline():
+
+    pass
+
+
+def call_nested(func, depth):
+
+    # statics should not get slower with a deeper call stack
+    if depth > 0:
+        return call_nested(func, depth - 1)
+
+    func()
+
+
+def measure(func, depth, calls):
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        call_nested(func, depth)
+
+    return time.perf_counter() - start
+
+
+def main():
+
+    calls = 100000
+
+    for depth in [0, 50]:
+
+        total = measure(widget, depth, calls) - measure(baseline, depth, calls)
+
+        print(f"statics, stack depth {depth:>2}: "
+              + f"{total / calls * 1e6:.2f} us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measures the array throughput of storage.save and storage.read_array
+for different numbers of io workers.
+"""
+
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+from imviz import storage
+
+
+class State:
+
+    def __init__(self):
+
+        # some images and a point cloud, about 330 MB in total
+        self.images = [np.random.rand(1024, 1024, 3).astype("float32")
+                       for _ in range(20)]
+        self.points = np.random.rand(5 * 10**6, 4).astype("float32")
+
+
+def main():
+
+    state = State()
+
+    nbytes = sum(i.nbytes for i in state.images) + state.points.nbytes
+
+    for backend in storage.ARRAY_BACKENDS:
+        for workers in [1, 4, 16]:
+
+            storage.set_io_workers(workers)
+
+            directory = tempfile.mkdtemp()
+
+            # a fresh copy, so that all arrays are written again
+            obj = State()
+            obj.images = [i.copy() for i in state.images]
+            obj.points = state.points.copy()
+
+            start = time.time()
+            storage.save(obj, directory, array_backend=backend)
+            save_time = time.time() - start
+
+            loaded = State()
+
+            start = time.time()
+            storage.load(loaded, directory)
+            for i in loaded.images:
+                storage.read_array(i)
+            storage.read_array(loaded.points)
+            load_time = time.time() - start
+
+            print(f"{backend:>4}, {workers:>2} workers: "
+                  + f"save {nbytes / save_time / 1e6:8.1f} MB/s, "
+                  + f"load {nbytes / load_time / 1e6:8.1f} MB/s")
+
+            storage.GC_POOL.submit(shutil.rmtree, directory).result()
+
+
+if __name__ == "__main__":
+    main()
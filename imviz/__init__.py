@@ -30,6 +30,9 @@ configure_ini_path(__main__)
 
 from imviz.common import *
 from imviz.autogui import render as autogui
+from imviz.autogui import register_renderer as register_autogui
+from imviz.aio import frames, run_async, new_event_loop, FrameEventLoopPolicy
+from imviz.dataframes import dataframe
 
 import imviz.dev
 import imviz.task
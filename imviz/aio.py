@@ -0,0 +1,245 @@
+"""
+This allows to run the imviz main loop in an asyncio event loop:
+
+    async def main():
+        async for frame in viz.frames():
+            ...
+
+    viz.run_async(main())
+
+While the ui is idle (powersave), the event loop waits for io in a helper
+thread and for ui events on the main thread at the same time. So
+coroutines run between frames without busy polling. Call viz.trigger()
+from a coroutine to render a new frame, e.g. if awaited data arrived.
+
+The event loop must run on the main thread (glfw requirement).
+"""
+
+import time
+import socket
+import asyncio
+import threading
+import selectors
+
+from concurrent.futures import ThreadPoolExecutor
+
+import imviz as viz
+
+
+class FrameSelector(selectors.BaseSelector):
+    """
+    Wraps the selector of an asyncio event loop and waits
+    for ui events, while the frames() driver is idle.
+    """
+
+    def __init__(self, selector=None):
+
+        if selector is None:
+            selector = selectors.DefaultSelector()
+
+        self.selector = selector
+
+        # allows to interrupt io waiting in the helper thread
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ)
+
+        self.io_pool = ThreadPoolExecutor(1)
+        self.lock = threading.Lock()
+        self.ui_waiting = False
+
+        self.ui_wait = None
+        """
+        Is (deadline, future) while frames() waits for ui events.
+        """
+
+    def register(self, fileobj, events, data=None):
+
+        return self.selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+
+        return self.selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+
+        return self.selector.modify(fileobj, events, data)
+
+    def get_key(self, fileobj):
+
+        return self.selector.get_key(fileobj)
+
+    def get_map(self):
+
+        return self.selector.get_map()
+
+    def close(self):
+
+        self.io_pool.shutdown()
+        self.selector.unregister(self.wake_recv)
+        self.wake_recv.close()
+        self.wake_send.close()
+        self.selector.close()
+
+    def filter_events(self, events):
+
+        return [(k, e) for k, e in events if k.fileobj is not self.wake_recv]
+
+    def select(self, timeout=None):
+
+        if self.ui_wait is not None and self.ui_wait[1].done():
+            self.ui_wait = None
+
+        if self.ui_wait is None:
+            return self.filter_events(self.selector.select(timeout))
+
+        deadline, ui_future = self.ui_wait
+
+        wait = max(0.0, deadline - time.monotonic())
+        if timeout is not None:
+            wait = min(wait, timeout)
+
+        events = self.filter_events(self.selector.select(0))
+
+        if len(events) == 0 and wait > 0.0:
+
+            start = time.monotonic()
+
+            with self.lock:
+                self.ui_waiting = True
+
+            io_future = self.io_pool.submit(self.select_io, wait)
+
+            ui_pending = viz.wait_events(wait)
+
+            with self.lock:
+                self.ui_waiting = False
+
+            self.wake_send.send(b"\0")
+            events = io_future.result()
+
+            try:
+                while self.wake_recv.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+            ui_event = ui_pending or time.monotonic() - start < wait
+        else:
+            # io must never delay requested frames or ui events
+            ui_event = viz.wait_events(0.0)
+
+        # wake the ui on ui events (or io, which triggered an ui event)
+        # but not if the event loop just needs to run a timer
+        if ui_event or time.monotonic() >= deadline:
+            self.ui_wait = None
+            ui_future.set_result(None)
+
+        return events
+
+    def select_io(self, timeout):
+
+        events = self.filter_events(self.selector.select(timeout))
+
+        with self.lock:
+            if len(events) > 0 and self.ui_waiting:
+                viz.trigger()
+
+        return events
+
+
+def new_event_loop():
+    """
+    Creates an asyncio event loop, which can wait for ui events.
+    """
+
+    selector = FrameSelector()
+
+    loop = asyncio.SelectorEventLoop(selector)
+    loop.frame_selector = selector
+
+    return loop
+
+
+class FrameEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """
+    Allows to use asyncio.run with frames() after calling
+    asyncio.set_event_loop_policy(viz.FrameEventLoopPolicy()).
+    """
+
+    def new_event_loop(self):
+
+        return new_event_loop()
+
+
+def run_async(main):
+    """
+    Like asyncio.run, but the coroutine runs in an event loop,
+    which can wait for ui events.
+    """
+
+    loop = new_event_loop()
+
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            tasks = asyncio.all_tasks(loop)
+            for t in tasks:
+                t.cancel()
+            loop.run_until_complete(
+                    asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+async def frames(vsync=True, powersave=True, timeout=1.0):
+    """
+    The asyncio version of the "while viz.wait()" main loop.
+    Yields the frame index until the window is closed.
+
+    Other coroutines run between frames. If the event loop was created
+    with new_event_loop (or run_async), idle frames wait for ui events
+    without blocking the event loop. Otherwise the ui is polled.
+    """
+
+    loop = asyncio.get_running_loop()
+    selector = getattr(loop, "frame_selector", None)
+
+    if selector is None and powersave:
+        print("Warning: viz.frames() cannot wait for ui events in this "
+              + "event loop, use viz.run_async() or viz.new_event_loop()")
+
+    frame = 0
+    powersave_counter = 5
+
+    try:
+        while True:
+
+            if viz.present(vsync):
+                if (powersave
+                        and selector is not None
+                        and powersave_counter <= 0):
+                    ui_future = loop.create_future()
+                    selector.ui_wait = (time.monotonic() + timeout,
+                                        ui_future)
+                    await ui_future
+                    powersave_counter = 5
+                else:
+                    viz.wait_events(0.0)
+                    powersave_counter -= 1
+                    await asyncio.sleep(0)
+
+            if not viz.begin_frame():
+                return
+
+            yield frame
+
+            frame += 1
+    finally:
+        if selector is not None:
+            selector.ui_wait = None
@@ -3,15 +3,71 @@ import typing
 import numbers
 import itertools
 
+import numpy as np
+
 import imviz as viz
 
 from imviz.storage import ext_setattr
 
 
+CLIP_MIN_ITEMS = 100
+"""
+Lists, tuples and arrays with at least this many items are clipped, which
+means that only the currently visible items are rendered. The clipper
+expects items of uniform height, so expanded items may slightly disturb
+the layout of very long lists.
+"""
+
+
+def visible_indices(count):
+    """
+    Returns the indices of all items, which need to be rendered.
+    """
+
+    if count < CLIP_MIN_ITEMS:
+        return range(count)
+
+    return viz.clipped_range(count)
+
+
+RENDERERS = {}
+"""
+Contains user registered renderers (type -> renderer).
+"""
+
+RENDER_PLANS = {}
+"""
+Caches the resolved renderer of each type
+(type -> (has __autogui__ method, renderer)).
+"""
+
+
+def register_renderer(cls, renderer):
+    """
+    Registers a renderer for all instances of cls (including subclasses).
+
+    The renderer is called like render(obj, name, path, parents,
+    annotation, ignore_custom) and must return the (modified) object.
+    An "__autogui__" method of the object still takes precedence.
+    """
+
+    RENDERERS[cls] = renderer
+    clear_render_plans()
+
+
+def clear_render_plans():
+    """
+    Forgets all resolved renderers. Must be called
+    whenever classes may have changed, e.g. after code reloading.
+    """
+
+    RENDER_PLANS.clear()
+
+
 def render(obj,
            name="",
-           path=[],
-           parents=[],
+           path=None,
+           parents=None,
            annotation=None,
            ignore_custom=False):
     """
@@ -19,14 +75,53 @@ def render(obj,
     (with best effort) for all fields of the object.
 
     Rendering can be customized by defining an "__autogui__"
-    method in the objects to be rendered.
+    method in the objects to be rendered or by registering
+    a renderer for a type with register_renderer.
+
+    The path and parents lists are modified in place while child objects
+    are rendered. Custom renderers must copy them if they need to keep them.
+    """
+
+    if path is None:
+        path = []
+    if parents is None:
+        parents = []
+
+    return dispatch(obj, name, path, parents, annotation, ignore_custom)
+
+
+def render_child(child, key, obj, name, path, parents,
+                 annotation=None, ignore_custom=False):
+    """
+    Renders a child of obj, which can be found under key.
+    Same as render, but without copying path and parents.
+    """
+
+    path.append(key)
+    parents.append(obj)
+
+    try:
+        return dispatch(
+                child, name, path, parents, annotation, ignore_custom)
+    finally:
+        path.pop()
+        parents.pop()
+
+
+def dispatch(obj, name, path, parents, annotation, ignore_custom):
+    """
+    Calls the "__autogui__" method or the resolved renderer of obj.
     """
 
     name = name.replace("_", " ")
 
-    obj_type = type(obj)
+    plan = RENDER_PLANS.get(type(obj))
+    if plan is None:
+        plan = resolve_renderer(obj)
 
-    if hasattr(obj, "__autogui__") and not ignore_custom:
+    has_custom, renderer = plan
+
+    if has_custom and not ignore_custom:
         return obj.__autogui__(
                 name=name,
                 path=path,
@@ -34,166 +129,233 @@ def render(obj,
                 annotation=annotation,
                 ignore_custom=ignore_custom)
 
+    return renderer(obj, name, path, parents, annotation, ignore_custom)
+
+
+def resolve_renderer(obj):
+    """
+    Determines how obj (and every other instance of its type) is rendered.
+    """
+
+    plan = find_renderer(obj)
+    RENDER_PLANS[type(obj)] = plan
+
+    return plan
+
+
+def find_renderer(obj):
+
+    obj_type = type(obj)
+
+    has_custom = hasattr(obj, "__autogui__")
+
+    for cls in obj_type.__mro__:
+        if cls in RENDERERS:
+            return has_custom, RENDERERS[cls]
+
     if obj is None:
-        viz.text(f"{name}: None")
-        return obj
+        return has_custom, render_none
 
     if obj_type == bool:
-        if name == "":
-            name = str(path[-1])
-        return viz.checkbox(name, obj)
+        return has_custom, render_bool
 
     if isinstance(obj, numbers.Integral):
-        if name == "":
-            name = str(path[-1])
-        return obj_type(viz.drag(name, obj, 1.0, 0, 0))
+        return has_custom, render_int
 
     if isinstance(obj, numbers.Real):
-        if name == "":
-            name = str(path[-1])
-        return obj_type(viz.drag(name, obj))
+        return has_custom, render_real
 
     if obj_type == str:
-        if name == "":
-            name = str(path[-1])
-        return viz.input(name, obj)
+        return has_custom, render_str
 
     if obj_type == tuple:
+        return has_custom, render_tuple
 
-        if len(name) > 0:
-            tree_open = viz.tree_node(f"{name} [{len(obj)}]-tuple###{name}")
-        else:
-            tree_open = True
+    if obj_type == list:
+        return has_custom, render_list
+
+    if hasattr(obj, "shape") and hasattr(obj, "__getitem__"):
+        return has_custom, render_array
 
-        if tree_open:
-            for i in range(len(obj)):
+    return has_custom, render_object
 
-                node_name = str(i)
 
-                if hasattr(obj[i], "name"):
-                    node_name += f" {obj[i].name}"
+def render_none(obj, name, path, parents, annotation, ignore_custom):
 
-                obj_tree_open = viz.tree_node(f"{node_name}###{i}")
+    viz.text(f"{name}: None")
+    return obj
 
-                if obj_tree_open:
 
-                    render(obj[i],
-                           "",
-                           path=[*path, i],
-                           parents=[*parents, obj],
-                           ignore_custom=ignore_custom)
+def render_bool(obj, name, path, parents, annotation, ignore_custom):
 
-                    viz.tree_pop()
+    if name == "":
+        name = str(path[-1])
+    return viz.checkbox(name, obj)
 
-        if len(name) > 0 and tree_open:
-            viz.tree_pop()
 
-        return obj
+def render_int(obj, name, path, parents, annotation, ignore_custom):
 
-    if obj_type == list:
+    if name == "":
+        name = str(path[-1])
+    return type(obj)(viz.drag(name, obj, 1.0, 0, 0))
 
-        if len(name) > 0:
-            tree_open = viz.tree_node(f"{name} [{len(obj)}]###{name}")
 
-            if viz.begin_popup_context_item():
-                if annotation is not None:
-                    item_type = typing.get_args(annotation)[0]
-                    if viz.menu_item("New"):
-                        obj.append(item_type())
-                        viz.set_mod(True)
-                if viz.menu_item("Clear"):
-                    obj.clear()
+def render_real(obj, name, path, parents, annotation, ignore_custom):
+
+    if name == "":
+        name = str(path[-1])
+    return type(obj)(viz.drag(name, obj))
+
+
+def render_str(obj, name, path, parents, annotation, ignore_custom):
+
+    if name == "":
+        name = str(path[-1])
+    return viz.input(name, obj)
+
+
+def render_tuple(obj, name, path, parents, annotation, ignore_custom):
+
+    if len(name) > 0:
+        tree_open = viz.tree_node(f"{name} [{len(obj)}]-tuple###{name}")
+    else:
+        tree_open = True
+
+    if tree_open:
+        for i in visible_indices(len(obj)):
+
+            node_name = str(i)
+
+            if hasattr(obj[i], "name"):
+                node_name += f" {obj[i].name}"
+
+            obj_tree_open = viz.tree_node(f"{node_name}###{i}")
+
+            if obj_tree_open:
+
+                render_child(obj[i], i, obj, "", path, parents,
+                             None, ignore_custom)
+
+                viz.tree_pop()
+
+    if len(name) > 0 and tree_open:
+        viz.tree_pop()
+
+    return obj
+
+
+def render_list(obj, name, path, parents, annotation, ignore_custom):
+
+    if len(name) > 0:
+        tree_open = viz.tree_node(f"{name} [{len(obj)}]###{name}")
+
+        if viz.begin_popup_context_item():
+            if annotation is not None:
+                item_type = typing.get_args(annotation)[0]
+                if viz.menu_item("New"):
+                    obj.append(item_type())
                     viz.set_mod(True)
-                viz.end_popup()
-        else:
-            tree_open = True
+            if viz.menu_item("Clear"):
+                obj.clear()
+                viz.set_mod(True)
+            viz.end_popup()
+    else:
+        tree_open = True
 
-        mod = False
+    remove_list = []
+    duplicate = (None, None)
 
-        remove_list = []
-        duplicate = (None, None)
+    if tree_open:
+        for i in visible_indices(len(obj)):
 
-        if tree_open:
-            for i in range(len(obj)):
+            node_name = str(i)
 
-                node_name = str(i)
+            if hasattr(obj[i], "shape"):
+                node_name += f" {list(obj[i].shape)}"
+            if hasattr(obj[i], "name"):
+                node_name += f" {obj[i].name}"
 
-                if hasattr(obj[i], "shape"):
-                    node_name += f" {list(obj[i].shape)}"
-                if hasattr(obj[i], "name"):
-                    node_name += f" {obj[i].name}"
+            obj_tree_open = viz.tree_node(f"{node_name}###{i}")
 
-                obj_tree_open = viz.tree_node(f"{node_name}###{i}")
+            if viz.begin_popup_context_item():
+                if viz.menu_item("Duplicate"):
+                    duplicate = (i, copy.deepcopy(obj[i]))
+                if viz.menu_item("Remove"):
+                    remove_list.append(i)
+                    viz.set_mod(True)
+                viz.end_popup()
 
-                if viz.begin_popup_context_item():
-                    if viz.menu_item("Duplicate"):
-                        duplicate = (i, copy.deepcopy(obj[i]))
-                    if viz.menu_item("Remove"):
-                        remove_list.append(i)
-                        viz.set_mod(True)
-                    viz.end_popup()
+            if obj_tree_open:
 
-                if obj_tree_open:
+                obj[i] = render_child(obj[i], i, obj, "", path, parents,
+                                      None, ignore_custom)
 
-                    obj[i] = render(
-                            obj[i],
-                            "",
-                            path=[*path, i],
-                            parents=[*parents, obj],
-                            ignore_custom=ignore_custom)
+                viz.tree_pop()
 
-                    viz.tree_pop()
+        if duplicate[0] is not None:
+            obj.insert(duplicate[0], duplicate[1])
 
-            if duplicate[0] is not None:
-                obj.insert(duplicate[0], duplicate[1])
+        for idx in remove_list:
+            obj.pop(idx)
 
-            for idx in remove_list:
-                obj.pop(idx)
+    if len(name) > 0 and tree_open:
+        viz.tree_pop()
 
-        if len(name) > 0 and tree_open:
-            viz.tree_pop()
+    return obj
 
-        return obj
 
-    if hasattr(obj, "shape") and hasattr(obj, "__getitem__"):
+def render_array(obj, name, path, parents, annotation, ignore_custom):
 
-        # to avoid many array lookups in the loop
-        # we collect the requested indices in "path"
-        indices = tuple(itertools.takewhile(
-                lambda x: isinstance(x[0], int) and type(x[1]) == type(obj),
-                    zip(path[::-1], parents[::-1])))[::-1]
-        indices = tuple(i[0] for i in indices)
+    # to avoid many array lookups in the loop
+    # we collect the requested indices in "path"
+    indices = tuple(itertools.takewhile(
+            lambda x: isinstance(x[0], int) and type(x[1]) == type(obj),
+                zip(path[::-1], parents[::-1])))[::-1]
+    indices = tuple(i[0] for i in indices)
 
-        li = len(indices)
+    li = len(indices)
 
-        if len(name) > 0:
-            tree_open = viz.tree_node(f"{name} {list(obj.shape)[li:]}")
-        else:
-            tree_open = True
+    if len(name) > 0:
+        tree_open = viz.tree_node(f"{name} {list(obj.shape)[li:]}")
+    else:
+        tree_open = True
+
+    mod = False
+
+    if tree_open:
+        if len(obj.shape) - li in (1, 2) and is_editable_array(obj):
+
+            mod = render_array_editor(obj, indices)
 
-        mod = False
+        elif len(obj.shape) == 2:
 
-        if tree_open:
-            if len(obj.shape) == 2:
+            width_avail, _ = viz.get_content_region_avail()
+            item_width = max(32, width_avail / obj.shape[1] - 8)
 
-                width_avail, _ = viz.get_content_region_avail()
-                item_width = max(32, width_avail / obj.shape[1] - 8)
+            # this tremendously speeds up zarr array access
+            # because we are now operating on a numpy array
+            arr_view = obj[:, :]
 
-                # this tremendously speeds up zarr array access
-                # because we are now operating on a numpy array
-                arr_view = obj[:, :]
+            parents.append(obj)
 
-                for i in range(obj.shape[0]):
+            try:
+                for i in visible_indices(obj.shape[0]):
+                    path.append(i)
                     for j in range(obj.shape[1]):
 
                         viz.set_next_item_width(item_width)
 
-                        res = render(
-                                arr_view[i, j],
-                                f"###{i},{j}",
-                                path=[*path, i, j],
-                                parents=[*parents, obj],
-                                ignore_custom=ignore_custom)
+                        path.append(j)
+
+                        try:
+                            res = render(
+                                    arr_view[i, j],
+                                    f"###{i},{j}",
+                                    path,
+                                    parents,
+                                    ignore_custom=ignore_custom)
+                        finally:
+                            path.pop()
 
                         if viz.mod():
                             mod = True
@@ -201,49 +363,100 @@ def render(obj,
 
                         if j < obj.shape[1]-1:
                             viz.same_line()
-            else:
-                # to avoid many array lookups in the loop
-                # we collect the requested indices in "path"
-
-                if len(obj.shape) < 2:
-                    arr_view = obj[:]
-                    for i in range(len(arr_view)):
-                        # lookup happens here
-                        res = render(
-                                arr_view[i],
-                                str(i),
-                                path=[*path, i],
-                                parents=[*parents, obj],
-                                ignore_custom=ignore_custom)
-                        if viz.mod():
-                            obj[i] = res
-                elif len(obj.shape) - li == 2:
+                    path.pop()
+            finally:
+                parents.pop()
+        else:
+            # to avoid many array lookups in the loop
+            # we collect the requested indices in "path"
+
+            if len(obj.shape) < 2:
+                arr_view = obj[:]
+                for i in visible_indices(len(arr_view)):
+                    # lookup happens here
+                    res = render_child(arr_view[i], i, obj, str(i),
+                                       path, parents, None, ignore_custom)
+                    if viz.mod():
+                        obj[i] = res
+            elif len(obj.shape) - li == 2:
+                parents.append(obj)
+                try:
                     # lookup happens here
                     res = render(
                             obj[indices],
-                            path=[*path],
-                            parents=[*parents, obj],
+                            path=path,
+                            parents=parents,
                             ignore_custom=ignore_custom)
-                    if viz.mod():
-                        obj[indices] = res
-                else:
-                    for i in range(obj.shape[li]):
-                        res = render(
-                                obj,
-                                str(i),
-                                path=[*path, i],
-                                parents=[*parents, obj],
-                                ignore_custom=ignore_custom)
-
+                finally:
+                    parents.pop()
                 if viz.mod():
-                    mod = True
+                    obj[indices] = res
+            else:
+                for i in visible_indices(obj.shape[li]):
+                    res = render_child(obj, i, obj, str(i),
+                                       path, parents, None, ignore_custom)
 
-        if len(name) > 0 and tree_open:
-            viz.tree_pop()
+            if viz.mod():
+                mod = True
 
-        viz.set_mod(mod)
+    if len(name) > 0 and tree_open:
+        viz.tree_pop()
 
-        return obj
+    viz.set_mod(mod)
+
+    return obj
+
+
+def is_editable_array(obj):
+    """
+    Checks if the array can be edited with the native array editor.
+    """
+
+    dtype = getattr(obj, "dtype", None)
+
+    # e.g. torch tensors have their own dtypes
+    if not isinstance(dtype, np.dtype) or not dtype.isnative:
+        return False
+
+    if dtype.kind == "f":
+        if dtype.itemsize not in (4, 8):
+            return False
+    elif dtype.kind in "iu":
+        if dtype.itemsize not in (1, 2, 4, 8):
+            return False
+    elif dtype.kind != "b":
+        return False
+
+    if isinstance(obj, np.ndarray):
+        return obj.flags.writeable
+
+    return True
+
+
+def render_array_editor(obj, indices):
+    """
+    Edits the 1d or 2d array at obj[indices] with the native array editor.
+    Returns True if the array was modified.
+    """
+
+    if isinstance(obj, np.ndarray):
+        # a view, edits go directly into the array memory
+        arr = obj[indices] if len(indices) > 0 else obj
+    else:
+        # e.g. zarr arrays, we edit a copy and write back modified cells
+        arr = np.asarray(obj[indices] if len(indices) > 0 else obj[...])
+
+    modified = viz.array_editor("##array_editor", arr)
+
+    if not isinstance(obj, np.ndarray):
+        for idx in modified:
+            idx = tuple(idx)
+            obj[indices + idx] = arr[idx]
+
+    return len(modified) > 0
+
+
+def render_object(obj, name, path, parents, annotation, ignore_custom):
 
     # default case, generic object
 
@@ -275,13 +488,8 @@ def render(obj,
             else:
                 annot = None
 
-            new_v = render(
-                        v,
-                        name=k,
-                        path=[*path, k],
-                        parents=[*parents, obj],
-                        annotation=annot,
-                        ignore_custom=ignore_custom)
+            new_v = render_child(
+                        v, k, obj, k, path, parents, annot, ignore_custom)
 
             try:
                 ext_setattr(obj, k, new_v)
@@ -69,9 +69,15 @@ Some of the known remaining caveats are:
 import os
 import gc
 import sys
+import site
 import types
 import queue
+import struct
+import hashlib
+import ctypes
 import weakref
+import sysconfig
+import ctypes.util
 
 from importlib import reload
 
@@ -83,6 +89,269 @@ import multiprocessing as mp
 # ------------------------------------------------------------------------------
 
 
+def get_excluded_dirs():
+    """
+    Returns the directories of installed packages and the standard library.
+    """
+
+    dirs = set()
+
+    for key in ["stdlib", "platstdlib", "purelib", "platlib"]:
+        try:
+            dirs.add(sysconfig.get_paths()[key])
+        except KeyError:
+            pass
+
+    try:
+        dirs.update(site.getsitepackages())
+    except AttributeError:
+        pass
+
+    try:
+        dirs.add(site.getusersitepackages())
+    except AttributeError:
+        pass
+
+    return tuple(os.path.join(os.path.realpath(d), "") for d in dirs)
+
+
+REAL_PATHS = {}
+"""
+Caches os.path.realpath for module origins.
+"""
+
+
+def get_real_path(path):
+
+    try:
+        return REAL_PATHS[path]
+    except KeyError:
+        real_path = os.path.realpath(path)
+        REAL_PATHS[path] = real_path
+        return real_path
+
+
+def get_module_origins(exclude_dirs=()):
+    """
+    Returns the source file of every module, which could be reloaded.
+    """
+
+    origins = {}
+
+    for name, mt in list(sys.modules.items()):
+
+        if name in [None, "__mp_main__", "__main__"]:
+            # we cannot reload(__main__) or reload(__mp_main__)
+            continue
+
+        try:
+            origin = mt.__spec__.origin
+        except AttributeError:
+            continue
+
+        if origin in [None, "built-in", "frozen"]:
+            # builtins or frozen modules will likely not change
+            continue
+
+        if exclude_dirs and get_real_path(origin).startswith(exclude_dirs):
+            continue
+
+        origins[name] = origin
+
+    return origins
+
+
+class InotifyWatcher:
+    """
+    Watches the directories of modules with inotify (linux only).
+    Changes are pushed by the kernel, so checking for changes only
+    costs a single non-blocking read.
+    """
+
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+
+    WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO
+
+    def __init__(self):
+
+        self.libc = ctypes.CDLL(
+                ctypes.util.find_library("c") or "libc.so.6",
+                use_errno=True)
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # watch descriptor -> directory
+        self.watches = {}
+        # directory -> watch descriptor
+        self.watched_dirs = {}
+        # (directory, file name) -> module names
+        self.files = {}
+        # module name -> (origin, mtime)
+        self.modules = {}
+
+    def close(self):
+
+        os.close(self.fd)
+
+    def watch(self, origins):
+        """
+        Starts watching the given modules (name -> origin),
+        which are not watched yet.
+        """
+
+        for name, origin in origins.items():
+
+            if name in self.modules and self.modules[name][0] == origin:
+                continue
+
+            directory, filename = os.path.split(get_real_path(origin))
+
+            if directory not in self.watched_dirs:
+                wd = self.libc.inotify_add_watch(
+                        self.fd, os.fsencode(directory), self.WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(),
+                                  f"inotify_add_watch failed for {directory}")
+                self.watches[wd] = directory
+                self.watched_dirs[directory] = wd
+
+            try:
+                mtime = os.stat(origin).st_mtime
+            except OSError:
+                mtime = 0
+
+            self.modules[name] = (origin, mtime)
+            self.files.setdefault((directory, filename), set()).add(name)
+
+    def changed(self):
+        """
+        Returns the names of all modules, which changed since the last call.
+        """
+
+        changed = set()
+        overflow = False
+
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+            offset = 0
+
+            while offset < len(data):
+
+                wd, mask, _, length = struct.unpack_from(
+                        "iIII", data, offset)
+                name = data[offset+16:offset+16+length].rstrip(b"\0")
+                offset += 16 + length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                if mask & self.IN_IGNORED:
+                    # the directory was removed
+                    directory = self.watches.pop(wd, None)
+                    self.watched_dirs.pop(directory, None)
+                    continue
+
+                try:
+                    key = (self.watches[wd], os.fsdecode(name))
+                    changed.update(self.files[key])
+                except KeyError:
+                    continue
+
+        if overflow:
+            # events were lost, fall back to comparing mtimes
+            for name, (origin, mtime) in self.modules.items():
+                try:
+                    if os.stat(origin).st_mtime > mtime:
+                        changed.add(name)
+                except OSError:
+                    continue
+
+        for name in list(changed):
+            if name not in sys.modules:
+                changed.discard(name)
+                continue
+            origin = self.modules[name][0]
+            try:
+                self.modules[name] = (origin, os.stat(origin).st_mtime)
+            except OSError:
+                # the file was removed (or is currently replaced)
+                changed.discard(name)
+
+        return list(changed)
+
+
+def source_hash(path):
+
+    try:
+        with open(path, "rb") as fd:
+            return hashlib.sha1(fd.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def module_dependencies(module, names):
+    """
+    Returns the modules (of the given module names),
+    which the module imports or imports objects from.
+    """
+
+    deps = set()
+
+    for value in list(module.__dict__.values()):
+        if isinstance(value, types.ModuleType):
+            dep = value.__name__
+        else:
+            try:
+                dep = value.__module__
+            except Exception:
+                continue
+        if dep in names and dep != module.__name__:
+            deps.add(dep)
+
+    return deps
+
+
+def sort_modules(names):
+    """
+    Sorts the module names, so that modules are
+    reloaded after the modules they depend on.
+    Import cycles are broken in the original order.
+    """
+
+    names = [n for n in names if n in sys.modules]
+    name_set = set(names)
+
+    deps = {n: module_dependencies(sys.modules[n], name_set) for n in names}
+
+    order = []
+    visited = set()
+
+    def visit(name):
+        if name in visited:
+            return
+        visited.add(name)
+        for dep in names:
+            if dep in deps[name]:
+                visit(dep)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+
+    return order
+
+
 def scan_modules(requests, results):
 
     while True:
@@ -96,14 +365,6 @@ def scan_modules(requests, results):
 
         for name, origin in req.items():
 
-            if name in [None, "__mp_main__", "__main__"]:
-                # we cannot reload(__main__) or reload(__mp_main__)
-                continue
-
-            if origin in [None, "built-in", "frozen"]:
-                # builtins or frozen modules will likely not change
-                continue
-
             try:
                 mtime = os.stat(origin).st_mtime
             except OSError:
@@ -120,18 +381,54 @@ def scan_modules(requests, results):
 
 
 class ModuleReloader:
+    """
+    Reloads modules, which changed on disk.
 
-    def __init__(self):
+    With backend "inotify" changes are pushed by the kernel (linux only).
+    With backend "poll" the mtimes of all modules are compared in a
+    subprocess. Backend "auto" uses inotify if available.
+
+    Modules of installed packages and of the standard library are
+    only watched if exclude_site_packages is False.
+
+    The instances of reloaded classes are found with one heap scan per
+    reload, unless the classes are decorated with track_instances.
+    """
+
+    def __init__(self, backend="auto", exclude_site_packages=True):
 
         self.waiting_for_scan = False
 
-        self.init_subproc()
+        if exclude_site_packages:
+            self.exclude_dirs = get_excluded_dirs()
+        else:
+            self.exclude_dirs = ()
+
+        self.watcher = None
+        self.watched_count = -1
+
+        if backend in ["auto", "inotify"]:
+            try:
+                self.watcher = InotifyWatcher()
+            except (OSError, AttributeError) as e:
+                if backend == "inotify":
+                    raise
+                print(f"Warning: inotify is not available ({e}), "
+                      + "falling back to polling for module changes")
+        elif backend != "poll":
+            raise ValueError(f"Unknown backend \"{backend}\"")
+
+        if self.watcher is None:
+            self.init_subproc()
 
         # (module-name, name) -> weakref, for replacing old code objects
         self.old_objects = {}
 
         self.mtime_table = {}
 
+        # module name -> hash of the source file
+        self.source_hashes = {}
+
     def init_subproc(self):
 
         self.waiting_for_scan = False
@@ -151,6 +448,67 @@ class ModuleReloader:
         Check whether some modules need to be reloaded.
         """
 
+        if self.watcher is not None:
+            changed = self.watch_changes()
+        else:
+            changed = self.scan_changes()
+
+        # touched files, whose content did not change, are skipped
+
+        changed = [n for n in changed if self.source_changed(n)]
+
+        # ok there are some modules we need to reload
+
+        if changed == []:
+            return False
+
+        modules = [sys.modules[n] for n in sort_modules(changed)]
+
+        superreload_batch(modules, reload, self.old_objects)
+
+        return True
+
+    def hash_sources(self, origins):
+
+        for name, origin in origins.items():
+            if name not in self.source_hashes:
+                self.source_hashes[name] = source_hash(origin)
+
+    def source_changed(self, name):
+
+        try:
+            origin = sys.modules[name].__spec__.origin
+        except (KeyError, AttributeError):
+            return False
+
+        new_hash = source_hash(origin)
+        old_hash = self.source_hashes.get(name)
+        self.source_hashes[name] = new_hash
+
+        return old_hash is None or old_hash != new_hash
+
+    def watch_changes(self):
+
+        # new modules are only watched if the module count changed
+        if len(sys.modules) != self.watched_count:
+            self.watched_count = len(sys.modules)
+            origins = get_module_origins(self.exclude_dirs)
+            self.hash_sources(origins)
+            try:
+                self.watcher.watch(origins)
+            except OSError as e:
+                # e.g. the inotify watch limit was reached
+                print(f"Warning: {e}, "
+                      + "falling back to polling for module changes")
+                self.watcher.close()
+                self.watcher = None
+                self.init_subproc()
+                return []
+
+        return self.watcher.changed()
+
+    def scan_changes(self):
+
         # check if the module scan was completed
 
         try:
@@ -168,27 +526,13 @@ class ModuleReloader:
 
             # submit currently imported modules to scan process
 
-            modules_to_scan = {}
-
-            for name, mt in sys.modules.items():
-                try:
-                    modules_to_scan[name] = mt.__spec__.origin
-                except AttributeError:
-                    continue
+            modules_to_scan = get_module_origins(self.exclude_dirs)
+            self.hash_sources(modules_to_scan)
 
             self.scan_requests.put((self.mtime_table, modules_to_scan))
             self.waiting_for_scan = True
 
-        # ok there are some modules we need to reload
-
-        if changed == []:
-            return False
-
-        for modname in changed:
-            m = sys.modules.get(modname, None)
-            superreload(m, reload, self.old_objects)
-
-        return True
+        return changed
 
 
 # ------------------------------------------------------------------------------
@@ -215,22 +559,173 @@ def update_function(old, new):
             pass
 
 
+INSTANCES = weakref.WeakKeyDictionary()
+"""
+Contains the live instances of tracked classes (class -> WeakSet).
+"""
+
+RELOAD_INSTANCES = {}
+"""
+Contains the instances of the untracked classes, which are currently
+reloaded (class -> list). Filled by one heap scan per reload.
+"""
+
+
+def track_instances(cls):
+    """
+    Class decorator, which registers all instances of cls created from
+    now on, so that reloading cls does not need to scan the gc heap.
+
+    This slows down the creation of instances, so it is only worth it
+    for classes in very large heaps. Classes, whose instances do not
+    support weak references, and classes with metaclasses are not tracked.
+    """
+
+    if cls in INSTANCES:
+        return cls
+
+    # only plain classes, whose instances support weak references
+    if type(cls) is not type or cls.__weakrefoffset__ == 0:
+        print(f"Warning: cannot track the instances of {cls.__name__}")
+        return cls
+
+    def __new__(klass, *args, **kwargs):
+
+        tracked_new = __new__.tracked_new
+
+        if tracked_new is not None:
+            obj = tracked_new(klass, *args, **kwargs)
+        else:
+            base_new = super(cls, klass).__new__
+            if base_new is object.__new__:
+                obj = object.__new__(klass)
+            else:
+                obj = base_new(klass, *args, **kwargs)
+
+        try:
+            INSTANCES[type(obj)].add(obj)
+        except KeyError:
+            INSTANCES[type(obj)] = weakref.WeakSet([obj])
+        except TypeError:
+            pass
+
+        return obj
+
+    set_tracked_new(__new__, cls, cls.__dict__.get("__new__"))
+
+    try:
+        cls.__new__ = staticmethod(__new__)
+    except (AttributeError, TypeError):
+        print(f"Warning: cannot track the instances of {cls.__name__}")
+        return cls
+
+    INSTANCES[cls] = weakref.WeakSet()
+
+    return cls
+
+
+def get_tracker(cls):
+    """
+    Returns the __new__ wrapper of a tracked class or None.
+    """
+
+    tracker = cls.__dict__.get("__new__")
+
+    if isinstance(tracker, staticmethod):
+        tracker = tracker.__func__
+
+    if hasattr(tracker, "tracked_new"):
+        return tracker
+
+    return None
+
+
+def set_tracked_new(tracker, cls, own_new):
+    """
+    Sets the __new__ method of the class itself (None if inherited),
+    which is called by the __new__ wrapper of a tracked class.
+    """
+
+    if isinstance(own_new, staticmethod):
+        own_new = own_new.__func__
+
+    # the new class may already be tracked itself
+    if hasattr(own_new, "tracked_new"):
+        own_new = own_new.tracked_new
+
+    tracker.tracked_new = own_new
+
+    # keeps inspect.signature(cls) as without the wrapper
+    if own_new is not None:
+        tracker.__wrapped__ = own_new
+    elif isinstance(getattr(cls, "__init__", None), types.FunctionType):
+        tracker.__wrapped__ = cls.__init__
+    elif hasattr(tracker, "__wrapped__"):
+        del tracker.__wrapped__
+
+
+def collect_instances(modules, old_objects):
+    """
+    Finds the instances of all untracked classes of the given modules
+    with one heap scan, instead of one gc.get_referrers call per class.
+    """
+
+    names = set(m.__name__ for m in modules)
+    classes = set()
+
+    for (module_name, _), refs in old_objects.items():
+        if module_name not in names:
+            continue
+        for ref in refs:
+            obj = ref()
+            if isinstance(obj, type) and obj not in INSTANCES:
+                classes.add(obj)
+
+    if len(classes) == 0:
+        return
+
+    for cls in classes:
+        RELOAD_INSTANCES[cls] = []
+
+    for obj in gc.get_objects():
+        cls = type(obj)
+        if cls in classes:
+            RELOAD_INSTANCES[cls].append(obj)
+
+
 def update_instances(old, new):
-    """Use garbage collector to find all instances that refer to the old
-    class definition and update their __class__ to point to the new class
-    definition"""
+    """Update the __class__ of all instances of the old class definition
+    to point to the new class definition. Tracked instances and instances
+    collected before the reload are updated directly, otherwise the
+    garbage collector is used to find them"""
+
+    try:
+        refs = list(INSTANCES[old])
+    except KeyError:
+        try:
+            refs = RELOAD_INSTANCES[old]
+        except KeyError:
+            refs = gc.get_referrers(old)
 
-    refs = gc.get_referrers(old)
+    new_instances = INSTANCES.get(new)
 
     for ref in refs:
         if type(ref) is old:
             ref.__class__ = new
+            if new_instances is not None:
+                new_instances.add(ref)
 
 
 def update_class(old, new):
     """Replace stuff in the __dict__ of a class, and upgrade
     method code objects, and add new methods, if any"""
+
+    # the __new__ wrapper of tracked classes must be kept
+    tracker = get_tracker(old)
+
     for key in list(old.__dict__.keys()):
+        if key == "__new__" and tracker is not None:
+            continue
         old_obj = getattr(old, key)
         try:
             new_obj = getattr(new, key)
@@ -261,6 +756,9 @@ def update_class(old, new):
             except (AttributeError, TypeError):
                 pass  # skip non-writable attributes
 
+    if tracker is not None:
+        set_tracked_new(tracker, old, new.__dict__.get("__new__"))
+
     # update all instances of class
     update_instances(old, new)
 
@@ -331,7 +829,11 @@ def append_obj(module, d, name, obj, autoload=False):
 
     key = (module.__name__, name)
     try:
-        d.setdefault(key, []).append(weakref.ref(obj))
+        ref = weakref.ref(obj)
+        refs = d.setdefault(key, [])
+        # avoids updating the same old object several times
+        if not any(r is ref for r in refs):
+            refs.append(ref)
     except TypeError:
         pass
     return True
@@ -347,17 +849,50 @@ def superreload(module, reload=reload, old_objects=None, shell=None):
     if old_objects is None:
         old_objects = {}
 
-    # collect old objects in the module
-    for name, obj in list(module.__dict__.items()):
-        if not append_obj(module, old_objects, name, obj):
-            continue
-        key = (module.__name__, name)
+    collect_old_objects(module, old_objects)
+    module = reload_module(module, reload)
+    update_old_objects(module, old_objects, shell)
+
+    return module
+
+
+def superreload_batch(modules, reload=reload, old_objects=None):
+    """Reloads several modules (in the given order) like superreload,
+    but old objects are only updated after all modules were reloaded.
+    If a module fails to reload, the modules reloaded so far are still
+    updated before the exception is raised. Returns the reloaded modules.
+    """
+    if old_objects is None:
+        old_objects = {}
+
+    for module in modules:
+        collect_old_objects(module, old_objects)
+
+    collect_instances(modules, old_objects)
+
+    reloaded = []
+
+    try:
+        for module in modules:
+            reloaded.append(reload_module(module, reload))
+    finally:
         try:
-            old_objects.setdefault(key, []).append(weakref.ref(obj))
-        except TypeError:
-            pass
+            for module in reloaded:
+                update_old_objects(module, old_objects)
+        finally:
+            RELOAD_INSTANCES.clear()
+
+    return reloaded
+
+
+def collect_old_objects(module, old_objects):
+
+    for name, obj in list(module.__dict__.items()):
+        append_obj(module, old_objects, name, obj)
+
+
+def reload_module(module, reload=reload):
 
-    # reload module
     try:
         # In contrast to the original superreload version
         # we do not clear the namespace, as this produces
@@ -373,6 +908,11 @@ def superreload(module, reload=reload, old_objects=None, shell=None):
         module.__dict__.update(old_dict)
         raise
 
+    return module
+
+
+def update_old_objects(module, old_objects, shell=None):
+
     # iterate over all objects and update functions & classes
     for name, new_obj in list(module.__dict__.items()):
         key = (module.__name__, name)
@@ -398,5 +938,3 @@ def superreload(module, reload=reload, old_objects=None, shell=None):
             old_objects[key] = new_refs
         else:
             del old_objects[key]
-
-    return module
@@ -3,18 +3,27 @@ This contains common and (mostly) helpful utils.
 """
 
 import os
+import sys
+import copy
 import time
+import types
 import pickle
-import inspect
 import hashlib
+import tempfile
 import traceback
+import threading
 import subprocess
 
 import __main__
 
+import numpy as np
+
+from collections import OrderedDict
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 from imviz.autoreload import ModuleReloader
+from imviz.autogui import clear_render_plans
 
 import imviz as viz
 
@@ -32,7 +41,13 @@ class bundle(dict):
 
 STATICS = {}
 """
-Contains all static function variables.
+Contains all static function variables (code object -> bundle).
+"""
+
+STATICS_BY_NAME = {}
+"""
+Contains all static function variables ((filename, qualified name) -> bundle).
+This is used to keep the statics of functions, which were reloaded.
 """
 
 
@@ -42,25 +57,54 @@ def statics(**defaults):
 
     It returns a bundle, which is unique to the calling function.
     Like static variables the bundle is persisted between function calls.
+    Defaults are only applied to keys, which are not yet in the bundle.
 
-    Use with caution! This implementation is probably not very performant,
-    but really useful for quick-and-dirty experimentation.
+    Use with caution! This is really useful for quick-and-dirty
+    experimentation, but hides state in a global dict.
     """
 
-    caller = inspect.stack()[1]
-    func_id = hash(caller.filename + caller.function)
+    code = sys._getframe(1).f_code
 
     try:
-        sts = STATICS[func_id]
-        sts = bundle({**defaults, **sts})
-        STATICS[func_id] = sts
+        sts = STATICS[code]
     except KeyError:
-        sts = bundle(defaults)
-        STATICS[func_id] = sts
+        # first call of this code object, but the function
+        # may have existed before it was reloaded
+        func_id = (code.co_filename,
+                   getattr(code, "co_qualname", code.co_name))
+        try:
+            sts = STATICS_BY_NAME[func_id]
+        except KeyError:
+            sts = bundle()
+            STATICS_BY_NAME[func_id] = sts
+        STATICS[code] = sts
+
+    for k, v in defaults.items():
+        if k not in sts:
+            sts[k] = v
 
     return sts
 
 
+def clipped_range(count, item_height=-1.0):
+    """
+    Like range(count), but only yields the indices of items, which are
+    currently visible in the window. Items are expected to be of uniform
+    height, which is measured from the first item if not given.
+
+    Use this to render long lists, where only a few items are visible.
+    """
+
+    clipper = viz.ListClipper()
+    clipper.begin(count, item_height)
+
+    try:
+        while clipper.step():
+            yield from range(clipper.display_start, clipper.display_end)
+    finally:
+        clipper.end()
+
+
 RELOADER = None
 """
 Contains a global module reloader for easier access.
@@ -86,7 +130,14 @@ def update_autoreload():
     if RELOADER is None:
         RELOADER = ModuleReloader()
 
-    return RELOADER.reload()
+    reloaded = RELOADER.reload()
+
+    if reloaded:
+        # reloaded classes may be serialized and rendered differently
+        viz.storage.clear_plan_cache()
+        clear_render_plans()
+
+    return reloaded
 
 
 @contextmanager
@@ -111,7 +162,7 @@ AUTOSAVE_TIME = {}
 
 
 @contextmanager
-def autosave(obj, path=".imviz_save", timeout=0.5):
+def autosave(obj, path=".imviz_save", timeout=0.5, array_backend="zarr"):
 
     if path not in AUTOSAVE_REQ:
         AUTOSAVE_REQ[path] = False
@@ -132,10 +183,28 @@ def autosave(obj, path=".imviz_save", timeout=0.5):
 
     if AUTOSAVE_REQ[path] and (time.time() - AUTOSAVE_TIME[path]) > timeout:
         AUTOSAVE_REQ[path] = False
-        viz.storage.save(obj, path)
+        viz.storage.save(obj, path, array_backend=array_backend)
 
 
-LATEX_IMG_CACHE = {}
+LATEX_IMG_CACHE = OrderedDict()
+"""
+Contains the rendered latex images (hash -> image) in lru order.
+"""
+
+LATEX_IMG_CACHE_SIZE = 256
+"""
+The maximum number of latex images kept in memory.
+"""
+
+LATEX_POOL = ThreadPoolExecutor(2)
+"""
+Renders latex images in the background.
+"""
+
+LATEX_JOBS = {}
+"""
+Contains the pending (or failed) latex renderings (hash -> future).
+"""
 
 if hasattr(__main__, "__file__"):
     wd = os.path.abspath(os.path.dirname(__main__.__file__))
@@ -146,7 +215,47 @@ LATEX_CACHE_DIR = os.path.join(wd, "__pycache__", "latex")
 os.makedirs(LATEX_CACHE_DIR, exist_ok=True)
 
 
+def render_latex(text, dpi, text_hash):
+    """
+    Renders the latex text to an image. The image files are kept in
+    LATEX_CACHE_DIR, so each text is only rendered once.
+    """
+
+    img_path = os.path.join(LATEX_CACHE_DIR, text_hash + ".png")
+
+    if not os.path.exists(img_path):
+
+        # concurrent renderings must not share their files
+        with tempfile.TemporaryDirectory(dir=LATEX_CACHE_DIR) as tmp_dir:
+
+            with open(os.path.join(tmp_dir, "lt.tex"), "w+") as fd:
+                fd.write(r"\documentclass[12pt]{standalone} \begin{document} "
+                         + text
+                         + r" \end{document}")
+
+            proc = subprocess.run(
+                    "latex -halt-on-error -interaction=nonstopmode "
+                    + "lt.tex "
+                    + f"&& dvipng -D {dpi} lt.dvi -o res.png",
+                    shell=True,
+                    cwd=tmp_dir,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE)
+
+            if proc.returncode != 0:
+                print(proc.stdout.decode("utf8") + "\n\n")
+                raise RuntimeError("Latex error: see console for details")
+
+            os.replace(os.path.join(tmp_dir, "res.png"), img_path)
+
+    return 255 - viz.load_image(img_path)
+
+
 def latex(text, dpi=120):
+    """
+    Renders latex text as image. Until the text is rendered in the
+    background, the plain text is shown instead.
+    """
 
     hasher = hashlib.sha1()
     hasher.update((text + str(dpi)).encode("utf8"))
@@ -155,33 +264,29 @@ def latex(text, dpi=120):
     latex_img = None
 
     if text_hash in LATEX_IMG_CACHE:
+        LATEX_IMG_CACHE.move_to_end(text_hash)
         latex_img = LATEX_IMG_CACHE[text_hash]
     else:
-        tmpl_path = os.path.join(LATEX_CACHE_DIR, "lt.tex")
-        with open(tmpl_path, "w+") as fd:
-            fd.write(r"\documentclass[12pt]{standalone} \begin{document} "
-                     + text
-                     + r" \end{document}")
-
-        proc = subprocess.run("latex -halt-on-error -interaction=nonstopmode "
-                              + "lt.tex "
-                              + f"&& dvipng -D {dpi} lt.dvi -o res.png",
-                              shell=True,
-                              cwd=LATEX_CACHE_DIR,
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE)
-
-        if proc.returncode == 0:
-            latex_img = viz.load_image(
-                    os.path.join(LATEX_CACHE_DIR, "res.png"))
-            latex_img = 255 - latex_img
+        job = LATEX_JOBS.get(text_hash)
+
+        if job is None:
+            job = LATEX_POOL.submit(render_latex, text, dpi, text_hash)
+            job.add_done_callback(lambda f: viz.trigger())
+            LATEX_JOBS[text_hash] = job
+
+        if job.done():
+            # failed jobs are kept, so that errors are not rendered again
+            latex_img = job.result()
+            del LATEX_JOBS[text_hash]
+
             LATEX_IMG_CACHE[text_hash] = latex_img
-        else:
-            print(proc.stdout.decode("utf8") + "\n\n")
-            raise RuntimeError("Latex error: see console for details")
+            while len(LATEX_IMG_CACHE) > LATEX_IMG_CACHE_SIZE:
+                LATEX_IMG_CACHE.popitem(last=False)
 
     if latex_img is not None:
         viz.image(text_hash, latex_img)
+    else:
+        viz.text(text, color=(0.5, 0.5, 0.5))
 
 
 class Selection():
@@ -211,52 +316,406 @@ class Selection():
             return None
 
 
+MOD_HISTORY_MAX_BYTES = 256 * 1024**2
+"""
+Default memory limit of a single modification history. If the recorded
+changes exceed this size, the oldest changes are evicted.
+"""
+
+NO_VALUE = object()
+"""
+Marks attributes and dict items, which do not exist (yet).
+"""
+
+SNAPSHOT_POOL = ThreadPoolExecutor(1)
+"""
+Compares captured states with the history base in the background.
+"""
+
+IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes,
+                   np.generic)
+
+
+def has_state_dict(obj):
+
+    return (hasattr(obj, "__dict__")
+            and not isinstance(obj, (type,
+                                     types.ModuleType,
+                                     types.FunctionType,
+                                     types.MethodType,
+                                     types.BuiltinFunctionType)))
+
+
+def capture_state(obj):
+    """
+    Returns a private copy of obj, which is cheap enough to be taken on the
+    main thread. Containers are copied, immutable values are shared, and
+    arrays are copied as a whole (no python loops, no comparisons).
+    """
+
+    if isinstance(obj, IMMUTABLE_TYPES):
+        return obj
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if type(obj) == dict:
+        return {k: capture_state(v) for k, v in obj.items()}
+    if type(obj) == list:
+        return [capture_state(v) for v in obj]
+    if type(obj) == tuple:
+        return tuple(capture_state(v) for v in obj)
+
+    if has_state_dict(obj):
+        obj_copy = copy.copy(obj)
+        if obj_copy is obj:
+            return obj
+        obj_copy.__dict__ = {k: capture_state(v)
+                             for k, v in obj.__dict__.items()}
+        return obj_copy
+
+    return copy.deepcopy(obj)
+
+
+def get_state_child(obj, step):
+
+    is_attr, key = step
+
+    if is_attr:
+        return getattr(obj, key, NO_VALUE)
+    if type(obj) == dict:
+        return obj.get(key, NO_VALUE)
+
+    return obj[key]
+
+
+def set_state_child(obj, step, value):
+
+    is_attr, key = step
+
+    if value is NO_VALUE:
+        if is_attr:
+            delattr(obj, key)
+        else:
+            del obj[key]
+    elif is_attr:
+        setattr(obj, key, value)
+    else:
+        obj[key] = value
+
+
+def states_equal(a, b):
+    """
+    Best effort comparison of two leaf values.
+    """
+
+    try:
+        if type(a).__eq__ is not object.__eq__:
+            return bool(a == b)
+    except Exception:
+        pass
+
+    try:
+        return pickle.dumps(a) == pickle.dumps(b)
+    except Exception:
+        return False
+
+
+def state_size(value):
+    """
+    Estimates the memory, which is needed to keep value in the history.
+    """
+
+    if value is NO_VALUE:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def diff_state(base, obj, path, changes):
+    """
+    Compares obj with base (a private copy of an earlier state of obj).
+    All differences are appended to changes and applied to base.
+
+    A change is a tuple (path, rows, old, new). If rows is None, the
+    value at path was replaced, otherwise only the given rows of the
+    array at path were modified.
+
+    Returns the updated base, which may be a new object.
+    """
+
+    if type(base) is not type(obj):
+        return replace_state(base, obj, path, changes)
+
+    if isinstance(obj, np.ndarray):
+        return diff_array(base, obj, path, changes)
+
+    if type(obj) == dict:
+        steps = [(False, k) for k in obj]
+        steps += [(False, k) for k in base if k not in obj]
+    elif type(obj) == list:
+        if len(obj) != len(base):
+            return replace_state(base, obj, path, changes)
+        steps = [(False, i) for i in range(len(obj))]
+    elif has_state_dict(obj):
+        obj_dict = obj.__dict__
+        base_dict = base.__dict__
+        steps = [(True, k) for k in obj_dict]
+        steps += [(True, k) for k in base_dict if k not in obj_dict]
+    else:
+        if states_equal(base, obj):
+            return base
+        return replace_state(base, obj, path, changes)
+
+    for step in steps:
+
+        b = get_state_child(base, step)
+        o = get_state_child(obj, step)
+
+        path.append(step)
+
+        if b is NO_VALUE or o is NO_VALUE:
+            if o is NO_VALUE:
+                changes.append((tuple(path), None, b, NO_VALUE))
+                set_state_child(base, step, NO_VALUE)
+            else:
+                changes.append((tuple(path), None, NO_VALUE, copy.deepcopy(o)))
+                set_state_child(base, step, copy.deepcopy(o))
+        else:
+            new_b = diff_state(b, o, path, changes)
+            if new_b is not b:
+                set_state_child(base, step, new_b)
+
+        path.pop()
+
+    return base
+
+
+def replace_state(base, obj, path, changes):
+
+    # base is not referenced anymore and can be kept as it is
+    changes.append((tuple(path), None, base, copy.deepcopy(obj)))
+
+    return copy.deepcopy(obj)
+
+
+def diff_array(base, obj, path, changes):
+
+    if (base.shape != obj.shape
+            or base.dtype != obj.dtype
+            or obj.dtype.kind == "O"
+            or obj.ndim == 0):
+        if (base.shape == obj.shape
+                and base.dtype == obj.dtype
+                and states_equal(base.tolist(), obj.tolist())):
+            return base
+        return replace_state(base, obj, path, changes)
+
+    if obj.size == 0:
+        return base
+
+    # compare in blocks of rows, which keeps temporary arrays small
+
+    base_rows = base.reshape(len(base), -1)
+    obj_rows = obj.reshape(len(obj), -1)
+
+    block = max(1, 2**24 // max(1, base_rows[0].nbytes))
+    is_float = obj.dtype.kind in "fc"
+
+    rows = []
+
+    for i in range(0, len(base_rows), block):
+        b = base_rows[i:i+block]
+        o = obj_rows[i:i+block]
+        neq = b != o
+        if is_float:
+            neq &= ~(np.isnan(b) & np.isnan(o))
+        rows.append(np.flatnonzero(neq.any(axis=1)) + i)
+
+    rows = np.concatenate(rows)
+
+    if len(rows) == 0:
+        return base
+
+    old = base[rows]
+    new = obj[rows]
+    base[rows] = new
+
+    changes.append((tuple(path), rows, old, new))
+
+    return base
+
+
+def apply_state_change(obj, change, undo):
+
+    path, rows, old, new = change
+
+    value = old if undo else new
+
+    parent = obj
+    for step in path[:-1]:
+        parent = get_state_child(parent, step)
+
+    if rows is not None:
+        if len(path) > 0:
+            parent = get_state_child(parent, path[-1])
+        parent[rows] = value
+    elif len(path) == 0:
+        obj.__dict__ = copy.deepcopy(value).__dict__
+    elif value is NO_VALUE:
+        set_state_child(parent, path[-1], NO_VALUE)
+    else:
+        set_state_child(parent, path[-1], copy.deepcopy(value))
+
+
 class ModHistory:
+    """
+    Records the modifications of an object as structural diffs.
+
+    Only the changed attributes, items and array rows are kept for
+    each modification. So undo and redo cost in proportion to the size of
+    the change. The full state is only copied once as the base for diffs.
+
+    With save_async the state is captured on the calling thread and
+    compared in the background. Captures, which are taken while the
+    worker is busy, are coalesced into a single modification.
+    """
 
     mod_counter = 0
 
-    def __init__(self):
+    def __init__(self, max_bytes=MOD_HISTORY_MAX_BYTES):
 
-        self.pos = -1
+        self.base = None
+        self.pos = 0
         self.history = []
+        self.nbytes = 0
+        self.max_bytes = max_bytes
         self.time = 0
         self.save_req = False
 
+        self.lock = threading.Lock()
+        self.pending = None
+        self.busy = False
+        self.future = None
+
     def save(self, obj):
 
-        ModHistory.mod_counter += 1
-        if self.pos < len(self.history) - 1:
-            self.history = self.history[:self.pos - len(self.history) + 1]
-        self.history.append((ModHistory.mod_counter, pickle.dumps(obj)))
-        self.pos += 1
+        self.flush()
+        self.record(capture_state(obj))
 
-    def get_undo_id(self):
+    def save_async(self, obj):
 
-        if self.pos - 1 >= 0:
-            return self.history[self.pos][0]
-        else:
-            return 0
+        state = capture_state(obj)
 
-    def get_undo_state(self):
+        with self.lock:
+            # replaces older captures, which were not processed yet
+            self.pending = state
+            if not self.busy:
+                self.busy = True
+                self.future = SNAPSHOT_POOL.submit(self.process)
 
-        if self.pos - 1 >= 0:
-            return pickle.loads(self.history[self.pos-1][1])
-        else:
-            return None
+    def process(self):
+
+        while True:
+            with self.lock:
+                state = self.pending
+                self.pending = None
+                if state is None:
+                    self.busy = False
+                    return
+            try:
+                self.record(state)
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self):
+        """
+        Waits until all captured states are recorded.
+        """
+
+        while True:
+            with self.lock:
+                if not self.busy:
+                    return
+                future = self.future
+            future.result()
+
+    def record(self, state):
+
+        if self.base is None:
+            self.base = state
+            return
+
+        changes = []
+        self.base = diff_state(self.base, state, [], changes)
+
+        if len(changes) == 0:
+            return
+
+        size = sum(state_size(c[2]) + state_size(c[3]) for c in changes)
+
+        with self.lock:
+
+            # undone changes cannot be redone anymore
+            for entry in self.history[self.pos:]:
+                self.nbytes -= entry[2]
+            del self.history[self.pos:]
+
+            ModHistory.mod_counter += 1
+
+            self.history.append((ModHistory.mod_counter, changes, size))
+            self.nbytes += size
+            self.pos += 1
+
+            # the most recent change is always kept
+            while self.nbytes > self.max_bytes and len(self.history) > 1:
+                self.nbytes -= self.history.pop(0)[2]
+                self.pos -= 1
+
+    def get_undo_id(self):
+
+        with self.lock:
+            if self.pos > 0:
+                return self.history[self.pos-1][0]
+            else:
+                return 0
 
     def get_redo_id(self):
 
-        if self.pos + 1 <= len(self.history) - 1:
-            return self.history[self.pos][0]
-        else:
-            return 0
+        with self.lock:
+            if self.pos < len(self.history):
+                return self.history[self.pos][0]
+            else:
+                return 0
 
-    def get_redo_state(self):
+    def undo(self, obj):
 
-        if self.pos + 1 <= len(self.history) - 1:
-            return pickle.loads(self.history[self.pos+1][1])
-        else:
-            return None
+        self.flush()
+
+        if self.pos <= 0:
+            return
+
+        self.pos -= 1
+
+        for change in reversed(self.history[self.pos][1]):
+            apply_state_change(obj, change, True)
+            apply_state_change(self.base, change, True)
+
+    def redo(self, obj):
+
+        self.flush()
+
+        if self.pos >= len(self.history):
+            return
+
+        for change in self.history[self.pos][1]:
+            apply_state_change(obj, change, False)
+            apply_state_change(self.base, change, False)
+
+        self.pos += 1
 
 
 MOD_HISTORIES = {}
@@ -265,7 +724,7 @@ REDO_CANDIDATE = None
 
 
 @contextmanager
-def mod_history(name, obj, timeout=0.5):
+def mod_history(name, obj, timeout=0.5, max_bytes=MOD_HISTORY_MAX_BYTES):
 
     global UNDO_CANDIDATE
     global REDO_CANDIDATE
@@ -275,19 +734,21 @@ def mod_history(name, obj, timeout=0.5):
     try:
         hist = MOD_HISTORIES[hist_id]
     except KeyError:
-        hist = ModHistory()
-        hist.save(obj)
+        hist = ModHistory(max_bytes)
+        hist.save_async(obj)
         MOD_HISTORIES[hist_id] = hist
 
     if UNDO_CANDIDATE == hist:
-        obj.__dict__ = hist.get_undo_state().__dict__
-        hist.pos -= 1
+        # pending modifications are recorded first, so they can be undone
+        if hist.save_req:
+            hist.save_req = False
+            hist.save(obj)
+        hist.undo(obj)
         UNDO_CANDIDATE = None
         viz.set_mod(True)
 
     if REDO_CANDIDATE == hist:
-        obj.__dict__ = hist.get_redo_state().__dict__
-        hist.pos += 1
+        hist.redo(obj)
         REDO_CANDIDATE = None
         viz.set_mod(True)
 
@@ -325,4 +786,4 @@ def mod_history(name, obj, timeout=0.5):
 
     if hist.save_req and (time.time() - hist.time) > timeout:
         hist.save_req = False
-        hist.save(obj)
+        hist.save_async(obj)
@@ -0,0 +1,324 @@
+"""
+A table widget for (pandas) dataframes with millions of rows.
+
+Only the visible rows are formatted. Numeric columns are read directly
+from their numpy buffers, all other columns are converted to strings
+once per row and cached until their data changes.
+
+Sorting (click on the headers, shift+click for multiple columns) and
+filtering (the row below the headers) compute the displayed rows with
+numpy. Numeric columns are filtered by ranges like "1..5", "..5", ">3"
+or "2", other columns by case insensitive substrings.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import imviz as viz
+
+
+DATAFRAME_CACHE = {}
+"""
+Contains the prepared columns of each dataframe widget (id -> cache).
+"""
+
+DATAFRAME_ASYNC_ROWS = 100000
+"""
+Frames with at least this many rows are sorted and filtered in the
+background, while the previous rows are still shown.
+"""
+
+DATAFRAME_POOL = ThreadPoolExecutor(1)
+"""
+Sorts and filters large frames in the background.
+"""
+
+
+class DataFrameCache:
+
+    def __init__(self, frame, version):
+
+        self.frame = frame
+        self.version = version
+
+        self.index = np.asarray(frame.index)
+
+        keys = list(frame.keys())
+
+        self.names = ["index"] + [str(k) for k in keys]
+        self.columns = [self.index] + [np.asarray(frame[k]) for k in keys]
+
+        # None means the column is read from its buffer,
+        # otherwise this caches the formatted values (row -> str)
+        self.texts = [None if is_numeric(c) else {} for c in self.columns]
+
+        self.rows = np.arange(len(self.index))
+
+        self.mask = np.zeros(len(self.index), dtype=bool)
+        self.selection = None
+
+        self.sort_specs = []
+        self.filters = [""] * len(self.columns)
+
+        # the sort specs and filters, which self.rows was computed for
+        self.rows_key = ((), tuple(self.filters))
+        self.job = None
+
+        # lower case strings of the columns for text filtering
+        self.search = [None] * len(self.columns)
+
+    def take_over(self, old):
+        """
+        Keeps what is still valid from the cache of the previous frame.
+        """
+
+        if old.names != self.names:
+            return
+
+        # keep sorting and filtering of updated frames
+        self.sort_specs = old.sort_specs
+        self.filters = old.filters
+
+        if len(old.index) != len(self.index):
+            return
+
+        # keep the rows and the pending job, otherwise frames
+        # passed anew every frame are never sorted
+        self.rows = old.rows
+        self.job = old.job
+
+        if old.version != self.version:
+            return
+
+        unchanged = True
+
+        for c, column in enumerate(self.columns):
+            if same_buffer(column, old.columns[c]):
+                # formatting is expensive, keep it for unchanged columns
+                self.texts[c] = old.texts[c]
+                self.search[c] = old.search[c]
+            else:
+                unchanged = False
+
+        if same_buffer(self.index, old.index):
+            self.mask = old.mask
+            self.selection = old.selection
+
+        # the rows are recomputed, unless the data is the same
+        if unchanged:
+            self.rows_key = old.rows_key
+
+    def update_mask(self, selection):
+        """
+        Updates the selection mask, if the selected index values changed.
+        """
+
+        if selection == self.selection:
+            return
+
+        self.mask[:] = False
+        if len(selection) > 0:
+            self.mask[np.isin(self.index, list(selection))] = True
+
+        self.selection = selection.copy()
+
+    def update_rows(self):
+        """
+        Recomputes the displayed rows, if sorting or filtering changed.
+        """
+
+        if self.job is not None:
+            if not self.job.done():
+                return
+            self.set_rows(self.job)
+            self.job = None
+
+        key = (tuple(self.sort_specs), tuple(self.filters))
+
+        if key == self.rows_key:
+            return
+
+        self.rows_key = key
+
+        if len(self.index) < DATAFRAME_ASYNC_ROWS:
+            self.set_rows(None, key)
+        else:
+            self.job = DATAFRAME_POOL.submit(self.compute_rows, *key)
+            self.job.add_done_callback(lambda f: viz.trigger())
+
+    def set_rows(self, job, key=None):
+
+        try:
+            if job is None:
+                self.rows = self.compute_rows(*key)
+            else:
+                self.rows = job.result()
+        except Exception as e:
+            print(f"Warning: could not sort or filter dataframe: {e}")
+
+    def compute_rows(self, sort_specs, filters):
+
+        mask = None
+
+        for c, text in enumerate(filters):
+            m = self.filter_column(c, text.strip())
+            if m is None:
+                continue
+            mask = m if mask is None else mask & m
+
+        if len(sort_specs) == 0:
+            if mask is None:
+                return np.arange(len(self.index))
+            return np.flatnonzero(mask)
+
+        # lexsort uses the last key as primary key
+        keys = [sort_key(self.columns[c], desc)
+                for c, desc in reversed(sort_specs)]
+        order = np.lexsort(keys)
+
+        if mask is not None:
+            order = order[mask[order]]
+
+        return order
+
+    def filter_column(self, c, text):
+
+        if text == "":
+            return None
+
+        column = self.columns[c]
+
+        if is_numeric(column):
+            bounds = parse_range(text)
+            if bounds is None:
+                return None
+            lo, hi = bounds
+            return (column >= lo) & (column <= hi)
+
+        if self.search[c] is None:
+            self.search[c] = np.char.lower(column.astype(str))
+
+        return np.char.find(self.search[c], text.lower()) >= 0
+
+
+def sort_key(column, descending):
+
+    if is_numeric(column) and not descending:
+        return column
+
+    # ranks also work for strings and descending order
+    try:
+        ranks = np.unique(column, return_inverse=True)[1]
+    except TypeError:
+        ranks = np.unique(column.astype(str), return_inverse=True)[1]
+
+    return -ranks if descending else ranks
+
+
+def parse_range(text):
+    """
+    Parses "a..b", "..b", "a..", ">a", "<b" or "a" to (min, max).
+    Returns None if the text is not a valid range.
+    """
+
+    try:
+        if ".." in text:
+            lo, hi = text.split("..", 1)
+            return (float(lo) if lo.strip() else -np.inf,
+                    float(hi) if hi.strip() else np.inf)
+        if text.startswith(">"):
+            return (float(text[1:].lstrip("=")), np.inf)
+        if text.startswith("<"):
+            return (-np.inf, float(text[1:].lstrip("=")))
+        value = float(text.lstrip("="))
+        return (value, value)
+    except ValueError:
+        return None
+
+
+def same_buffer(a, b):
+    """
+    Checks if both arrays view the same memory in the same way.
+    """
+
+    return a is b or (a.dtype == b.dtype
+                      and a.shape == b.shape
+                      and a.strides == b.strides
+                      and (a.__array_interface__["data"][0]
+                           == b.__array_interface__["data"][0]))
+
+
+def is_numeric(column):
+
+    return (column.ndim == 1
+            and column.dtype.kind in "biuf"
+            and column.dtype.isnative)
+
+
+def dataframe(frame, label="", selection=None, version=0):
+    """
+    Renders a dataframe as table with a checkbox for each row.
+
+    The selection is a list or set of index values, or a bool array with
+    one entry per row. It is modified in place and returned. Bool arrays
+    and sets are fastest, lists are converted to a mask on change.
+
+    Numeric values are always up to date, other values are only
+    formatted once. If another frame is passed, only columns with
+    different data (another buffer) are formatted again. Change the
+    version to update all cached values. The sorting and filtering is
+    recomputed, if any column data or the version changes.
+    """
+
+    if selection is None:
+        selection = []
+
+    cache_id = viz.get_id(label)
+    cache = DATAFRAME_CACHE.get(cache_id)
+
+    if (cache is None
+            or cache.frame is not frame
+            or cache.version != version
+            or len(cache.index) != len(frame.index)):
+        old_cache = cache
+        cache = DataFrameCache(frame, version)
+        if old_cache is not None:
+            cache.take_over(old_cache)
+        DATAFRAME_CACHE[cache_id] = cache
+
+    cache.update_rows()
+
+    if isinstance(selection, np.ndarray):
+        mask = selection
+    else:
+        cache.update_mask(selection)
+        mask = cache.mask
+
+    toggled, sort_specs, _ = viz.dataframe_table(
+            label, cache.names, cache.columns, cache.texts,
+            cache.rows, mask, cache.filters)
+
+    if sort_specs is not None:
+        cache.sort_specs = sort_specs
+
+    if mask is selection:
+        return selection
+
+    for r in toggled:
+        value = cache.index[r]
+        if type(selection) == set:
+            if mask[r]:
+                selection.add(value)
+            else:
+                selection.discard(value)
+        else:
+            if mask[r] and value not in selection:
+                selection.append(value)
+            elif not mask[r] and value in selection:
+                selection.remove(value)
+
+    if len(toggled) > 0:
+        cache.selection = selection.copy()
+
+    return selection
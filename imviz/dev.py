@@ -1,13 +1,48 @@
 import os
 import sys
 import inspect
+import tokenize
 import datetime
 import traceback
 
 import imviz as viz
 
+from imviz.autogui import visible_indices
 
-def launch(cls, func_name):
+
+PRELOAD_MODULES = [
+    "numpy",
+    "scipy",
+    "pandas",
+    "zarr",
+    "torch",
+    "cv2",
+    "matplotlib",
+]
+"""
+Heavy modules, which the fork server imports once, if they are
+already imported by the launching process.
+"""
+
+RESTART_EXIT_CODE = 75
+"""
+The app process exits with this code to request a restart.
+"""
+
+FORK_SERVER = False
+"""
+Is True if the app process was forked by the fork server.
+"""
+
+
+def launch(cls, func_name, fork_server=True, preload=None):
+    """
+    Restarts python with the given class running in dev.loop.
+
+    With fork_server, a parent process keeps the preloaded modules
+    (by default the already imported modules of PRELOAD_MODULES) and
+    forks a fresh app process, whenever restart() is called.
+    """
 
     file_path = os.path.abspath(sys.modules[cls.__module__].__file__)
 
@@ -17,23 +52,111 @@ def launch(cls, func_name):
     os.environ["PYTHONPATH"] = ":".join(
             sys.path + [os.path.dirname(file_path)])
 
+    if not fork_server or not hasattr(os, "fork"):
+        os.execlpe("python3",
+                   "python3",
+                   "-m",
+                   "imviz.dev_main",
+                   cls_name,
+                   func_name,
+                   os.environ)
+
+    if preload is None:
+        preload = [n for n in PRELOAD_MODULES if n in sys.modules]
+
     os.execlpe("python3",
                "python3",
-               "-m",
-               "imviz.dev_main",
+               os.path.join(os.path.dirname(__file__), "dev_server.py"),
                cls_name,
                func_name,
+               "--preload",
+               ",".join(preload),
                os.environ)
 
 
+def restart():
+    """
+    Restarts the app, e.g. after changes, which cannot be reloaded.
+    This is fast if the app was started by launch with the fork server.
+    """
+
+    if FORK_SERVER:
+        sys.exit(RESTART_EXIT_CODE)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    os.execvp(sys.orig_argv[0], sys.orig_argv)
+
+
+SOURCE_CACHE = {}
+"""
+Contains the loaded source files (path -> (mtime, lines, colors)).
+"""
+
+SOURCE_COLOR = (1.0, 1.0, 1.0)
+COMMENT_COLOR = (0.5, 0.6, 0.5)
+LINENO_COLOR = (0.4, 0.4, 0.4)
+ERROR_COLOR = (1.0, 0.3, 0.3)
+
+
 def try_load_source(path):
+    """
+    Returns the lines of a source file and the color of each line.
+    Files are only read again if they were modified.
+    """
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except Exception:
+        return [], []
+
+    cached = SOURCE_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
 
     try:
         with open(path) as fd:
             source = fd.readlines()
-        return source
     except Exception:
-        return ""
+        return [], []
+
+    colors = source_colors(source)
+    SOURCE_CACHE[path] = (mtime, source, colors)
+
+    return source, colors
+
+
+def source_colors(source):
+    """
+    Determines the text color of each source line.
+    """
+
+    colors = [SOURCE_COLOR] * len(source)
+
+    try:
+        tokens = tokenize.generate_tokens(iter(source).__next__)
+        for t in tokens:
+            if t.type == tokenize.COMMENT and t.line.lstrip().startswith("#"):
+                colors[t.start[0]-1] = COMMENT_COLOR
+    except (tokenize.TokenError, SyntaxError, IndexError):
+        pass
+
+    return colors
+
+
+def render_vars(variables, ignore_custom=False):
+    """
+    Renders a dict of variables. Like in autogui, only the currently
+    visible ones are rendered if there are many of them.
+    """
+
+    names = list(variables.keys())
+
+    for i in visible_indices(len(names)):
+        k = names[i]
+        variables[k] = viz.autogui(variables[k], k, [k], [variables],
+                                   ignore_custom=ignore_custom)
 
 
 def loop(cls, func_name):
@@ -50,7 +173,9 @@ def loop(cls, func_name):
     exc_tb = None
     exc_frames = None
     exc_frame_idx = -1
+    exc_locals = None
     exc_code = None
+    exc_colors = None
 
     new_stack_frame_sel = False
 
@@ -83,6 +208,9 @@ def loop(cls, func_name):
                     viz.text(exc_str, color=col)
                     viz.text("\n")
 
+                    if viz.button("Restart"):
+                        restart()
+
                     viz.separator()
 
                     for i, f in enumerate(exc_frames):
@@ -91,18 +219,19 @@ def loop(cls, func_name):
                                 + " at line {f.lineno} in {f.function}",
                                 i == exc_frame_idx):
                             exc_frame_idx = i
-                            exc_code = try_load_source(f.filename)
+                            exc_locals = f.frame.f_locals
+                            exc_code, exc_colors = try_load_source(
+                                    f.filename)
                             new_stack_frame_sel = True
 
                 viz.end_window()
 
                 if viz.begin_window("Local variables"):
-                    f_locals = exc_frames[exc_frame_idx].frame.f_locals
-                    viz.autogui(f_locals, ignore_custom=True)
+                    render_vars(exc_locals, ignore_custom=True)
                 viz.end_window()
 
                 if viz.begin_window("App state"):
-                    viz.autogui(obj.__dict__)
+                    render_vars(obj.__dict__)
                 viz.end_window()
 
                 if viz.begin_window("Source code"):
@@ -118,26 +247,43 @@ def loop(cls, func_name):
                                 "source",
                                 viz.TableColumnFlags.WIDTH_STRETCH)
 
-                        for i, l in enumerate(exc_code):
-                            if i == exc_frames[exc_frame_idx].lineno-1:
-                                lineno_color = (1.0, 0.3, 0.3)
-                                source_color = (1.0, 0.3, 0.3)
-                                if new_stack_frame_sel:
-                                    viz.set_scroll_here_y(0.5)
-                                    new_stack_frame_sel = False
+                        err_line = exc_frames[exc_frame_idx].lineno - 1
+
+                        # the error line must be rendered once to scroll
+                        # there, afterwards only visible lines are rendered
+                        if new_stack_frame_sel:
+                            lines = range(len(exc_code))
+                        else:
+                            lines = viz.clipped_range(len(exc_code))
+
+                        for i in lines:
+                            if i == err_line:
+                                lineno_color = ERROR_COLOR
+                                source_color = ERROR_COLOR
                             else:
-                                lineno_color = (0.4, 0.4, 0.4)
-                                source_color = (1.0, 1.0, 1.0)
+                                lineno_color = LINENO_COLOR
+                                source_color = exc_colors[i]
 
+                            viz.table_next_row()
                             viz.table_next_column()
+
+                            # the cursor must be in the row of the error line
+                            if i == err_line and new_stack_frame_sel:
+                                viz.set_scroll_here_y(0.5)
+                                new_stack_frame_sel = False
+
                             viz.text(str(i+1), color=lineno_color)
                             viz.table_next_column()
-                            viz.text(l, color=source_color)
-                            viz.table_next_row()
+                            viz.text(exc_code[i], color=source_color)
+
+                        new_stack_frame_sel = False
+
                         viz.end_table()
                 viz.end_window()
 
-        except SystemExit:
+        except SystemExit as e:
+            if e.code == RESTART_EXIT_CODE:
+                raise
             return
         except Exception:
             traceback.print_exc()
@@ -148,6 +294,7 @@ def loop(cls, func_name):
             (exc_type, exc_value, exc_tb) = sys.exc_info()
             exc_frames = inspect.getinnerframes(exc_tb)
             exc_frame_idx = max(0, len(exc_frames) - 1)
-            exc_code = try_load_source(exc_frames[-1].filename)
+            exc_locals = exc_frames[-1].frame.f_locals
+            exc_code, exc_colors = try_load_source(exc_frames[-1].filename)
 
             new_stack_frame_sel = True
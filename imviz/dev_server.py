@@ -0,0 +1,136 @@
+"""
+The fork server used by imviz.dev.launch.
+
+This script imports heavy modules once and then forks a fresh app process,
+which imports imviz and the app class. If the app process requests a
+restart (see imviz.dev.restart), a new app process is forked, which skips
+the interpreter startup and the already imported modules.
+
+It is run as a script (not with -m), because importing the imviz package
+creates the main window, which must not be shared by the forked processes.
+"""
+
+import os
+import sys
+import signal
+import argparse
+import importlib
+import traceback
+
+
+RESTART_EXIT_CODE = 75
+"""
+App processes exit with this code to request a restart.
+Must match imviz.dev.RESTART_EXIT_CODE.
+"""
+
+IMVIZ_DEPS = [
+    "numpy",
+    "json",
+    "pydoc",
+    "asyncio",
+    "inspect",
+    "tokenize",
+    "multiprocessing",
+    "concurrent.futures",
+]
+"""
+Modules imported by imviz itself, which are always preloaded.
+"""
+
+
+def preload(names):
+
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Warning: could not preload {name}: {e}")
+
+
+def run_app(class_name, func_name):
+
+    code = 0
+
+    try:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        import imviz.dev
+        import imviz.dev_main
+
+        from pydoc import locate
+
+        # importing imviz configured the ini of this script,
+        # keep using the one of "python -m imviz.dev_main"
+        imviz.configure_ini_path(imviz.dev_main)
+
+        imviz.dev.FORK_SERVER = True
+
+        cls = locate(class_name)
+
+        if cls is None:
+            print(f"Could not find class {class_name}")
+            code = 1
+        else:
+            imviz.dev.loop(cls, func_name)
+    except SystemExit as e:
+        code = e.code if type(e.code) == int else 0
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def main():
+
+    # the script directory is the imviz package, which must not be imported
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path = [p for p in sys.path
+                if os.path.abspath(p or os.curdir) != script_dir]
+
+    parser = argparse.ArgumentParser(
+            description="Launch a class with automatic code reloading"
+                        + " and fast restarts")
+
+    parser.add_argument(
+            "class_name",
+            type=str,
+            help="the name of the class to instantiate")
+
+    parser.add_argument(
+            "func_name",
+            type=str,
+            help="the name of the method to call")
+
+    parser.add_argument(
+            "--preload",
+            type=str,
+            default="",
+            help="comma separated names of modules to import once")
+
+    args = parser.parse_args()
+
+    preload(IMVIZ_DEPS + [n for n in args.preload.split(",") if n != ""])
+
+    # ctrl+c is handled by the app process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+
+        pid = os.fork()
+
+        if pid == 0:
+            run_app(args.class_name, args.func_name)
+
+        _, status = os.waitpid(pid, 0)
+        code = os.waitstatus_to_exitcode(status)
+
+        if code != RESTART_EXIT_CODE:
+            sys.exit(code if code >= 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
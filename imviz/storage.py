@@ -7,14 +7,30 @@ This has the advantage that we can update most of the code without thinking
 too much about how this will fit the already stored data.
 
 The storage system also takes care of handling larger numpy arrays, which makes
-working with images or points clouds much easier.
+working with images or points clouds much easier. Large arrays are either
+stored as zarr arrays (the default) or as raw .npy files, which are loaded as
+copy-on-write memory-mapped numpy arrays without any decompression or copying.
+
+Array chunks are encoded, compressed and written by a pool of io workers,
+so that multiple arrays and multiple parts of each array are processed
+concurrently. The number of workers can be configured with set_io_workers.
+
+Saving is crash-consistent. New external arrays and the new state are written
+and fsynced before "state.json" is atomically replaced. Every save increments
+the state generation. Arrays, which are no longer referenced by the current
+generation, are garbage collected later in a background thread.
 """
 
 import os
+import mmap
 import json
 import types
 import shutil
+import hashlib
 import numbers
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 # i still like this
 from pydoc import locate
@@ -88,6 +104,157 @@ def ext_setattr(obj, name, value):
         setattr(obj, name, value)
 
 
+def fsync_path(path):
+    """
+    Flushes a file or directory to disk.
+    """
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # directories cannot be opened on some platforms
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_tree(path):
+    """
+    Flushes all files and directories below path to disk.
+    """
+
+    for root, _, files in os.walk(path):
+        for f in files:
+            fsync_path(os.path.join(root, f))
+        fsync_path(root)
+
+
+def referenced_arrays(json_obj, refs=None):
+    """
+    Collects the paths of all external arrays referenced in a json state.
+    """
+
+    if refs is None:
+        refs = set()
+
+    if type(json_obj) == dict:
+        if json_obj.get("__class__", None) == "__extern__":
+            refs.add(json_obj["path"])
+        else:
+            for v in json_obj.values():
+                referenced_arrays(v, refs)
+    elif type(json_obj) == list:
+        for v in json_obj:
+            referenced_arrays(v, refs)
+
+    return refs
+
+
+def stored_arrays(ext_path):
+    """
+    Returns a dict mapping the names of all external arrays
+    found on disk (including partially written ones) to their ids.
+    """
+
+    try:
+        names = os.listdir(ext_path)
+    except OSError:
+        return {}
+
+    arrays = {}
+
+    for n in names:
+        array_id = n.split(".")[0]
+        if array_id.isdigit():
+            arrays[n] = int(array_id)
+
+    return arrays
+
+
+STORAGE_LOCKS = {}
+"""
+Serializes commits and garbage collection per storage directory.
+"""
+
+STORAGE_LOCKS_LOCK = threading.Lock()
+
+
+def get_storage_lock(directory):
+
+    directory = os.path.abspath(directory)
+
+    with STORAGE_LOCKS_LOCK:
+        try:
+            lock = STORAGE_LOCKS[directory]
+        except KeyError:
+            lock = threading.Lock()
+            STORAGE_LOCKS[directory] = lock
+
+    return lock
+
+
+GC_POOL = ThreadPoolExecutor(1)
+"""
+Removes unused external arrays in the background.
+"""
+
+
+def collect_garbage(directory):
+    """
+    Removes all external arrays, which are not referenced by the
+    committed state in directory.
+
+    Only arrays with ids up to the committed "__imviz_last_id" are
+    considered, so arrays of a concurrently running save are never touched.
+    Unused arrays are first moved to a trash directory and then deleted.
+    """
+
+    ext_path = os.path.join(directory, "extern")
+    trash_path = os.path.join(directory, "trash")
+    state_path = os.path.join(directory, "state.json")
+
+    with get_storage_lock(directory):
+
+        try:
+            with open(state_path, "r") as fd:
+                json_state = json.load(fd)
+        except (OSError, ValueError):
+            # without a valid committed state nothing can be collected
+            return
+
+        last_id = json_state.get("__imviz_last_id", 0)
+        generation = json_state.get("__imviz_generation", 0)
+        refs = referenced_arrays(json_state)
+
+        unused = [n for n, i in stored_arrays(ext_path).items()
+                  if i <= last_id and n not in refs]
+
+        if len(unused) > 0:
+            os.makedirs(trash_path, exist_ok=True)
+
+        for n in unused:
+            os.rename(os.path.join(ext_path, n),
+                      os.path.join(trash_path, f"{generation}.{n}"))
+
+    # the slow part happens outside of the lock
+
+    if os.path.isdir(trash_path):
+        for name in os.listdir(trash_path):
+            trash = os.path.join(trash_path, name)
+            if os.path.isdir(trash):
+                shutil.rmtree(trash, ignore_errors=True)
+            else:
+                try:
+                    os.remove(trash)
+                except OSError:
+                    pass
+
+
 ZARR_CHUNK_STORES = {}
 
 
@@ -102,10 +269,170 @@ def get_chunk_store(path):
     return chunk_store
 
 
+ARRAY_BACKENDS = ["zarr", "npy"]
+"""
+Available formats for externally stored arrays.
+"""
+
+
+def is_mapped_npy(obj, ext_path):
+    """
+    Checks if obj is a whole .npy file memory-mapped from ext_path.
+    Views into such arrays do not qualify, as they only cover parts of it.
+    """
+
+    if not isinstance(obj, np.memmap) or obj.filename is None:
+        return False
+
+    if not isinstance(obj.base, mmap.mmap):
+        return False
+
+    file_dir = os.path.dirname(obj.filename)
+
+    return file_dir == os.path.abspath(ext_path)
+
+
+IO_POOL = ThreadPoolExecutor(8)
+"""
+Encodes, compresses, reads and writes array chunks in parallel.
+"""
+
+
+def set_io_workers(count):
+    """
+    Sets the number of threads used for array io.
+    """
+
+    global IO_POOL
+
+    old_pool = IO_POOL
+    IO_POOL = ThreadPoolExecutor(max(1, count))
+    old_pool.shutdown(wait=False)
+
+
+def chunk_slabs(shape, chunks):
+    """
+    Splits an array along its first axis into slabs of whole chunks.
+    As no chunk is shared between slabs, they can be processed in parallel.
+    """
+
+    if len(shape) == 0:
+        return [()]
+
+    step = max(1, chunks[0])
+
+    return [slice(i, min(i + step, shape[0]))
+            for i in range(0, shape[0], step)]
+
+
+def copy_slab(dst, src, slab):
+
+    dst[slab] = src[slab]
+
+
+def read_array(arr, out=None):
+    """
+    Reads a whole (zarr) array into a numpy array,
+    decompressing the array chunks in parallel.
+    Arrays returned by load are not read, unless this is called
+    (or they are copies of other zarr arrays).
+    """
+
+    if out is None:
+        out = np.empty(arr.shape, dtype=arr.dtype)
+
+    chunks = getattr(arr, "chunks", arr.shape)
+
+    futures = [IO_POOL.submit(copy_slab, out, arr, slab)
+               for slab in chunk_slabs(arr.shape, chunks)]
+
+    for f in futures:
+        f.result()
+
+    return out
+
+
+def write_npy(path, arr):
+    """
+    Creates a .npy file for arr and returns it memory-mapped from there.
+    The content is copied in parallel, the returned futures must be
+    completed before the file is complete.
+
+    The returned map is copy-on-write, so that modifications never reach
+    the file, which may belong to a committed state.
+    """
+
+    out = np.lib.format.open_memmap(
+            path, mode="w+", dtype=arr.dtype, shape=arr.shape)
+
+    # one slab per megabyte
+    row_size = max(1, arr[:1].nbytes)
+    rows = max(1, 2**20 // row_size)
+
+    futures = [IO_POOL.submit(copy_slab, out, arr, slab)
+               for slab in chunk_slabs(arr.shape, (rows,))]
+
+    # unmodified pages of private maps show the writes (on linux)
+    stored = np.lib.format.open_memmap(path, mode="c")
+
+    return stored, futures
+
+
+def same_content(a, b):
+    """
+    Checks if two arrays with the same memory layout have the same bytes.
+    The arrays are compared in slabs to avoid large temporary arrays.
+    """
+
+    if a.dtype != b.dtype or a.shape != b.shape:
+        return False
+
+    a = a.ravel(order="K").view(np.uint8)
+    b = b.ravel(order="K").view(np.uint8)
+
+    step = 2**24
+
+    for i in range(0, len(a), step):
+        if not np.array_equal(a[i:i + step], b[i:i + step]):
+            return False
+
+    return True
+
+
+def write_zarr(array_store, path, arr):
+    """
+    Creates a zarr array for arr in the array store.
+    The chunks are compressed and written in parallel, the returned
+    futures must be completed before the array is complete.
+    """
+
+    stored = array_store.create(path, shape=arr.shape, dtype=arr.dtype)
+
+    futures = [IO_POOL.submit(copy_slab, stored, arr, slab)
+               for slab in chunk_slabs(arr.shape, stored.chunks)]
+
+    return stored, futures
+
+
+def array_hash(arr):
+    """
+    Returns a hash of the dtype, shape and content of an array.
+    """
+
+    hasher = hashlib.sha1()
+    hasher.update((arr.dtype.str + str(arr.shape)).encode("utf8"))
+    hasher.update(np.ascontiguousarray(arr).data)
+
+    return hasher.hexdigest()
+
+
 class Serializer:
     """
     Converts an object tree into a json serializeable object tree.
     Large numpy arrays are automatically referenced and stored externally.
+    Arrays occuring multiple times in the tree (by identity or by content)
+    are only stored once. Separate arrays with equal content share the
+    stored file, but stay separate objects.
     """
 
     last_id = 0
@@ -113,15 +440,123 @@ class Serializer:
     Used to name external arrays. Will only be incremented.
     """
 
-    def __init__(self, path, hide_private=True):
+    def __init__(self, path, hide_private=True, array_backend="zarr"):
+
+        if array_backend not in ARRAY_BACKENDS:
+            raise ValueError(f"Unknown array backend {array_backend}")
 
         self.path = path
         self.hide_private = hide_private
+        self.array_backend = array_backend
 
         self.ext_path = os.path.join(path, "extern")
         self.array_store = zarr.open(get_chunk_store(self.ext_path))
 
         self.saved_arrays = set()
+        self.written_arrays = set()
+
+        # unfinished array writes
+        self.futures = []
+
+        # id -> (array, path, stored array)
+        self.array_ids = {}
+
+        # content hash -> path
+        self.array_hashes = {}
+
+        # path -> first object referencing the external array
+        self.extern_objects = {}
+
+    def store_array(self, arr):
+        """
+        Stores arr externally, unless the same array or an array with
+        identical content was already stored by this serializer.
+        Returns the path and the stored version of the array.
+
+        The stored versions replace the arrays in the tree, so arrays with
+        equal content only share the file, never the stored object.
+        """
+
+        try:
+            _, path, stored = self.array_ids[id(arr)]
+            return path, stored
+        except KeyError:
+            pass
+
+        content_hash = array_hash(arr)
+
+        try:
+            path = self.array_hashes[content_hash]
+            if path.endswith(".npy"):
+                # another copy-on-write map of the same file
+                stored = np.lib.format.open_memmap(
+                        os.path.join(self.ext_path, path), mode="c")
+            else:
+                # zarr arrays write through, so arr stays in memory
+                stored = arr
+        except KeyError:
+
+            Serializer.last_id += 1
+
+            if self.array_backend == "npy":
+                path = f"{Serializer.last_id}.npy"
+                stored, futures = write_npy(
+                        os.path.join(self.ext_path, path), arr)
+            else:
+                path = str(Serializer.last_id)
+                stored, futures = write_zarr(self.array_store, path, arr)
+
+            self.futures += futures
+            self.written_arrays.add(path)
+            self.array_hashes[content_hash] = path
+
+        # keeping a reference to arr ensures its id is not reused
+        self.array_ids[id(arr)] = (arr, path, stored)
+
+        return path, stored
+
+    def extern_ref(self, path, obj):
+        """
+        Returns the reference to an external array. If other objects
+        already referenced the same array, obj is marked as a copy,
+        which is loaded as a separate array.
+        """
+
+        self.saved_arrays.add(path)
+
+        ref = {
+            "__class__": "__extern__",
+            "path": path
+        }
+
+        if self.extern_objects.setdefault(path, obj) is not obj:
+            ref["copy"] = True
+
+        return ref
+
+    def finish(self):
+        """
+        Waits until all written arrays are complete and flushed to disk.
+        """
+
+        futures, self.futures = self.futures, []
+
+        for f in futures:
+            f.result()
+
+        def sync(path):
+            arr_path = os.path.join(self.ext_path, path)
+            if os.path.isdir(arr_path):
+                fsync_tree(arr_path)
+            else:
+                fsync_path(arr_path)
+
+        futures = [IO_POOL.submit(sync, p) for p in self.written_arrays]
+
+        for f in futures:
+            f.result()
+
+        fsync_path(self.ext_path)
 
     def serialize(self, obj, key="", parent=None):
 
@@ -129,80 +564,107 @@ class Serializer:
             if self.hide_private and len(key) > 0 and key[0] == "_":
                 return Skip
 
-        # skip any kind of function
-        if (isinstance(obj, types.FunctionType)
-                or isinstance(obj, types.MethodType)
-                or isinstance(obj, types.LambdaType)):
-            return Skip
+        try:
+            plan = SERIALIZE_PLANS[type(obj)]
+        except KeyError:
+            plan = resolve_serialize_plan(obj)
+            SERIALIZE_PLANS[type(obj)] = plan
 
-        # special treatment for numpy arrays
-        if type(obj) == np.ndarray:
-            if obj.size > 25:
+        return plan(self, obj, key, parent)
 
-                Serializer.last_id += 1
 
-                path = str(Serializer.last_id)
-                obj = self.array_store.array(path, obj)
-
-                if type(key) == str:
-                    ext_setattr(parent, key, obj)
-                elif type(key) == int:
-                    parent[key] = obj
-
-                self.saved_arrays.add(path)
-                return {
-                    "__class__": "__extern__",
-                    "path": path
-                }
-            else:
-                return {
-                    "__class__": full_type(obj),
-                    "dtype": obj.dtype.name,
-                    "data": obj.tolist()
-                }
-
-        # already saved arrays
-        if type(obj) == zarr.core.Array:
-            self.saved_arrays.add(obj.path)
-            return {
-                "__class__": "__extern__",
-                "path": obj.path
-            }
-
-        if type(obj) == list or type(obj) == tuple:
-            jvs = []
-            for i, v in enumerate(obj):
-                jv = self.serialize(v, i, parent=obj)
-                if jv is not Skip:
-                    jvs.append(jv)
-            return jvs
+def serialize_skip(ser, obj, key, parent):
 
-        # try to get a dict representation of the object
+    return Skip
 
-        attrs = None
 
-        if hasattr(obj, "__getstate__"):
-            attrs = obj.__getstate__()
-        elif hasattr(obj, "__dict__"):
-            attrs = obj.__dict__
-        elif hasattr(obj, "__slots__"):
-            attrs = {n: getattr(obj, n) for n in obj.__slots__}
-        elif isinstance(obj, dict):
-            attrs = obj
+def serialize_primitive(ser, obj, key, parent):
+
+    return obj
+
+
+def serialize_unknown(ser, obj, key, parent):
+
+    print(f"Warning: cannot save object {key} of type {full_type(obj)}")
+    return Skip
+
+
+def serialize_memmap(ser, obj, key, parent):
+
+    # already saved arrays
+    if is_mapped_npy(obj, ser.ext_path):
+        path = os.path.basename(obj.filename)
+        if obj.mode == "c":
+            # the stored file is never modified, changed arrays are
+            # stored as new arrays to keep the committed state intact
+            stored = np.load(obj.filename, mmap_mode="r")
+            if not same_content(obj, stored):
+                return serialize_ndarray(ser, obj, key, parent)
+        else:
+            # writes back modifications done via the memory map
+            obj.flush()
+        return ser.extern_ref(path, obj)
+
+    # memory-mapped arrays from elsewhere are saved as regular arrays
+    return serialize_ndarray(ser, np.asarray(obj), key, parent)
+
+
+def serialize_ndarray(ser, obj, key, parent):
+
+    if obj.size > 25:
+
+        path, obj = ser.store_array(obj)
+
+        if type(key) == str:
+            ext_setattr(parent, key, obj)
+        elif type(key) == int:
+            parent[key] = obj
+
+        return ser.extern_ref(path, obj)
+    else:
+        return {
+            "__class__": "numpy.ndarray",
+            "dtype": obj.dtype.name,
+            "data": obj.tolist()
+        }
+
+
+def serialize_zarr(ser, obj, key, parent):
+
+    # already saved arrays
+    return ser.extern_ref(obj.path, obj)
+
+
+def serialize_sequence(ser, obj, key, parent):
+
+    serialize = ser.serialize
+
+    jvs = []
+    for i, v in enumerate(obj):
+        jv = serialize(v, i, obj)
+        if jv is not Skip:
+            jvs.append(jv)
+    return jvs
+
+
+def attrs_serializer(get_attrs, type_name):
+    """
+    Creates a plan for objects, which are serialized via a dict of attributes.
+    """
+
+    def serialize_attrs(ser, obj, key, parent):
+
+        attrs = get_attrs(obj)
 
         if attrs is None:
-            # in case we don't find any serializeable attributes
-            # we check if we have a primitive type and return that
-            if isinstance(obj, (numbers.Integral, numbers.Real, str, type(None))):
-                return obj
-            else:
-                print(f"Warning: cannot save object {key} of type {full_type(obj)}")
-                return Skip
+            return serialize_unknown(ser, obj, key, parent)
+
+        serialize = ser.serialize
 
         ser_attrs = {}
 
         for k, v in attrs.items():
-            val = self.serialize(v, k, parent=obj)
+            val = serialize(v, k, obj)
             if val is not Skip:
                 ser_attrs[k] = val
 
@@ -210,15 +672,166 @@ class Serializer:
             return Skip
 
         # store the full type so we can compare it later
-        ser_attrs["__class__"] = full_type(obj)
+        ser_attrs["__class__"] = type_name
 
         return ser_attrs
 
+    return serialize_attrs
+
+
+def get_dict_attrs(obj):
+
+    return obj.__dict__
+
+
+def get_mapping_attrs(obj):
+
+    return obj
+
+
+def get_state_attrs(obj):
+
+    return obj.__getstate__()
+
+
+def slots_getter(names):
+
+    if type(names) == str:
+        names = (names,)
+
+    names = tuple(names)
+
+    def get_slots_attrs(obj):
+        return {n: getattr(obj, n) for n in names}
+
+    return get_slots_attrs
+
+
+DEFAULT_GETSTATE = getattr(object, "__getstate__", None)
+"""
+Since python 3.11 every object has a __getstate__ method.
+Only custom implementations are of interest for us.
+"""
+
+
+SERIALIZE_PLANS = {}
+"""
+Caches how instances of a type are serialized (type -> plan).
+"""
+
+
+def resolve_serialize_plan(obj):
+    """
+    Determines how obj (and every other instance of its type) is serialized.
+    """
+
+    cls = type(obj)
+
+    # skip any kind of function
+    if (isinstance(obj, types.FunctionType)
+            or isinstance(obj, types.MethodType)
+            or isinstance(obj, types.LambdaType)):
+        return serialize_skip
+
+    # special treatment for numpy arrays
+    if isinstance(obj, np.memmap):
+        return serialize_memmap
+    if cls == np.ndarray:
+        return serialize_ndarray
+
+    if cls == zarr.core.Array:
+        return serialize_zarr
+
+    if cls == list or cls == tuple:
+        return serialize_sequence
+
+    # try to get a dict representation of the object
+
+    get_attrs = None
+
+    getstate = getattr(cls, "__getstate__", None)
+
+    if getstate is not None and getstate is not DEFAULT_GETSTATE:
+        get_attrs = get_state_attrs
+    elif hasattr(obj, "__dict__"):
+        get_attrs = get_dict_attrs
+    elif hasattr(obj, "__slots__"):
+        get_attrs = slots_getter(obj.__slots__)
+    elif isinstance(obj, dict):
+        get_attrs = get_mapping_attrs
+
+    if get_attrs is not None:
+        return attrs_serializer(get_attrs, full_type(obj))
+
+    # in case we don't find any serializeable attributes
+    # we check if we have a primitive type and return that
+    if isinstance(obj, (numbers.Integral, numbers.Real, str, type(None))):
+        return serialize_primitive
+
+    return serialize_unknown
+
+
+LOAD_PLANS = {}
+"""
+Caches how attributes of a type are accessed when loading
+(type -> (attribute getter or None, has __setstate__)).
+"""
+
+
+def resolve_load_plan(obj):
+    """
+    Determines how the attributes of obj (and every
+    other instance of its type) are accessed when loading.
+    """
+
+    get_attrs = None
+
+    if hasattr(obj, "__dict__"):
+        get_attrs = get_dict_attrs
+    elif hasattr(obj, "__slots__"):
+        get_attrs = slots_getter(obj.__slots__)
+    elif isinstance(obj, dict):
+        get_attrs = get_mapping_attrs
+
+    return get_attrs, hasattr(obj, "__setstate__")
+
+
+LOCATED_TYPES = {}
+"""
+Caches the results of locate (full type name -> type).
+"""
+
+
+def locate_type(name):
+
+    try:
+        return LOCATED_TYPES[name]
+    except KeyError:
+        cls = locate(name)
+        # unknown types may become available later on
+        if cls is not None:
+            LOCATED_TYPES[name] = cls
+        return cls
+
+
+def clear_plan_cache():
+    """
+    Forgets all cached plans and types. Must be called
+    whenever classes may have changed, e.g. after code reloading.
+    """
+
+    SERIALIZE_PLANS.clear()
+    LOAD_PLANS.clear()
+    LOCATED_TYPES.clear()
+
 
 class Loader:
     """
     Loads an object tree from a json file.
-    External numpy arrays are automatically dereferenced and mem-mapped.
+    External numpy arrays are automatically dereferenced. Arrays stored as
+    zarr arrays are opened as such, .npy arrays are mem-mapped.
+    Multiple references to the same external array yield the same object,
+    unless they were separate arrays with equal content when saved.
     """
 
     def __init__(self, path):
@@ -230,6 +843,26 @@ class Loader:
 
         self.loaded_arrays = set()
 
+        # path -> loaded array
+        self.arrays = {}
+
+    def open_array(self, path, copy=False):
+
+        if path.endswith(".npy"):
+            # copy-on-write, the file may still be
+            # referenced by the committed state
+            return np.load(os.path.join(self.ext_path, path), mmap_mode="c")
+
+        # we are lying about this one (actually zarr.core.Array)
+        # in practice it should behave (mostly) like ndarray
+        arr = self.array_store[path]
+
+        if copy:
+            # zarr arrays write through to the shared file
+            return read_array(arr)
+
+        return arr
+
     def load(self, obj, json_obj):
 
         t = type(obj)
@@ -244,10 +877,16 @@ class Loader:
 
             if cls == "__extern__":
                 path = json_obj["path"]
-                json_obj = self.array_store[path]
+                if json_obj.get("copy", False):
+                    # a separate array, which shares the file with others
+                    json_obj = self.open_array(path, copy=True)
+                else:
+                    try:
+                        json_obj = self.arrays[path]
+                    except KeyError:
+                        json_obj = self.open_array(path)
+                        self.arrays[path] = json_obj
                 self.loaded_arrays.add(path)
-                # we are lying about this one (actually zarr.core.Array)
-                # in practice it should behave (mostly) like ndarray
                 jt = np.ndarray
             elif cls == "numpy.ndarray":
                 json_obj = np.array(json_obj["data"], dtype=json_obj["dtype"])
@@ -255,14 +894,16 @@ class Loader:
 
         # try to get a dict representation of the object
 
+        try:
+            get_attrs, has_setstate = LOAD_PLANS[t]
+        except KeyError:
+            get_attrs, has_setstate = resolve_load_plan(obj)
+            LOAD_PLANS[t] = (get_attrs, has_setstate)
+
         attrs = None
 
-        if hasattr(obj, "__dict__"):
-            attrs = obj.__dict__
-        elif hasattr(obj, "__slots__"):
-            attrs = {n: getattr(obj, n) for n in obj.__slots__}
-        elif isinstance(obj, dict):
-            attrs = obj
+        if get_attrs is not None:
+            attrs = get_attrs(obj)
 
         # now check how we should continue
 
@@ -270,7 +911,7 @@ class Loader:
 
             # handles general objects and dicts
 
-            if hasattr(obj, "__setstate__"):
+            if has_setstate:
                 ld = {k: self.load(None, v) for k, v in json_obj.items()}
                 if "__class__" in ld:
                     del ld["__class__"]
@@ -310,7 +951,7 @@ class Loader:
                 # try constructing a new object
                 cls_name = json_obj["__class__"]
                 try:
-                    cls = locate(cls_name)
+                    cls = locate_type(cls_name)
                     # assumes default initializeable type
                     return self.load(cls(), json_obj)
                 except Exception:
@@ -335,47 +976,62 @@ class Loader:
             return obj
 
 
-def save(obj, directory):
+def save(obj, directory, array_backend="zarr"):
     """
     Stores obj under a given directory.
     The directory will be created if it not already exists.
-    """
 
-    # write to json
+    New large arrays are stored with the given array backend, either as
+    compressed zarr arrays ("zarr") or as memory-mappable .npy files ("npy").
+
+    The new state only becomes visible after all of its data has been
+    flushed to disk. Unused arrays are removed in the background.
+    """
 
     os.makedirs(directory, exist_ok=True)
 
-    ser = Serializer(directory)
-    rep = ser.serialize(obj)
+    state_path = os.path.join(directory, "state.json")
+    unfinished_path = os.path.join(directory, "unfinished.json")
+
+    with get_storage_lock(directory):
 
-    rep["__imviz_last_id"] = Serializer.last_id
+        try:
+            with open(state_path, "r") as fd:
+                generation = json.load(fd).get("__imviz_generation", 0)
+        except (OSError, ValueError):
+            generation = 0
 
-    unfinished_path = os.path.join(directory, "unfinished.json")
+        ser = Serializer(directory, array_backend=array_backend)
+        rep = ser.serialize(obj)
 
-    with open(unfinished_path, "w+") as fd:
-        json.dump(rep, fd, indent=2)
+        # make the new arrays durable before anything references them
 
-    state_path = os.path.join(directory, "state.json")
+        ser.finish()
 
-    os.rename(unfinished_path, state_path)
+        rep["__imviz_last_id"] = Serializer.last_id
+        rep["__imviz_generation"] = generation + 1
 
-    # remove unused external numpy arrays
+        with open(unfinished_path, "w+") as fd:
+            json.dump(rep, fd, indent=2)
+            fd.flush()
+            os.fsync(fd.fileno())
 
-    on_disk = set(ser.array_store.keys())
-    unused = on_disk - ser.saved_arrays
+        # atomically switch to the new generation
 
-    for k in unused:
-        del ser.array_store[k]
+        os.replace(unfinished_path, state_path)
+        fsync_path(directory)
 
-        # because zarr does not clean up emtpy folders
-        arr_path = os.path.join(ser.ext_path, k)
-        if os.path.isdir(arr_path):
-            shutil.rmtree(arr_path)
+    GC_POOL.submit(collect_garbage, directory)
 
 
 def load(obj, path):
     """
     Updates obj with data stored at the given path.
+
+    Loading stays lazy and is not parallelized: external arrays are
+    memory-mapped (npy) or opened (zarr), their content is only read on
+    access. Use read_array to read a whole array in parallel. Only zarr
+    arrays, which shared their file with other arrays, are read at once.
     """
 
     state_path = os.path.join(path, "state.json")
@@ -386,20 +1042,14 @@ def load(obj, path):
     with open(state_path, "r") as fd:
         json_state = json.load(fd)
 
-    Serializer.last_id = json_state["__imviz_last_id"]
+    # arrays of an interrupted save may exist beyond the committed last id,
+    # we must never hand out their ids again
+
+    Serializer.last_id = max([
+        json_state["__imviz_last_id"],
+        *stored_arrays(os.path.join(path, "extern")).values()])
 
     lod = Loader(path)
     lod.load(obj, json_state)
 
-    # remove unused external numpy arrays
-
-    on_disk = set(lod.array_store.keys())
-    unused = on_disk - lod.loaded_arrays
-
-    for k in unused:
-        del lod.array_store[k]
-
-        # because zarr does not clean up emtpy folders
-        arr_path = os.path.join(lod.ext_path, k)
-        if os.path.isdir(arr_path):
-            shutil.rmtree(arr_path)
+    GC_POOL.submit(collect_garbage, path)
@@ -1,42 +1,545 @@
-from concurrent.futures import ThreadPoolExecutor
+import time
+import inspect
+import threading
+import multiprocessing
+import concurrent.futures
 
+from collections import deque
 
-THREAD_POOL = ThreadPoolExecutor(32)
-TASK_FUTURES = {}
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 
+import imviz as viz
 
-def start(tid, func, *args, **kwargs):
+# the worker side lives outside of the imviz package,
+# so that workers never import cppimviz (and create a window)
+from imviz_worker import (
+        receive_arrays,
+        TaskCancelled,
+        Token,
+        SharedToken,
+        run_shared)
+
+
+EXECUTOR_KINDS = ["thread", "process", "interpreter"]
+"""
+Tasks can run in a thread (default), in a separate process, or in a
+separate interpreter (python >= 3.14). Process and interpreter tasks are
+not limited by the GIL, but functions, arguments and results must be
+picklable.
+"""
+
+LIMIT_MODES = ["queue", "coalesce"]
+"""
+If a tid reached its concurrency limit, new tasks either wait in a queue
+or replace the task, which is already waiting ("coalesce").
+"""
+
+
+TOKEN_PARAMETER = "cancel_token"
+"""
+Task functions with a parameter of this name are passed a Token.
+"""
+
+
+def accepts_token(func):
+
+    try:
+        return TOKEN_PARAMETER in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+class TaskStats:
     """
-    This calls the given function in a background thread.
-    Multiple calls with the same tid will interrupt already running tasks.
+    Statistics of all tasks with the same tid. Times are in seconds.
     """
 
-    try:
-        task_future = TASK_FUTURES[tid]
+    def __init__(self):
+
+        self.submitted = 0
+        self.waiting = 0
+        self.running = 0
+        self.finished = 0
+        self.failed = 0
+        self.cancelled = 0
+
+        self.wait_time = 0.0
+        self.run_time = 0.0
+        self.max_wait_time = 0.0
+        self.max_run_time = 0.0
+        self.last_wait_time = 0.0
+        self.last_run_time = 0.0
+
+    def mean_wait_time(self):
+
+        return self.wait_time / max(1, self.finished + self.failed)
+
+    def mean_run_time(self):
+
+        return self.run_time / max(1, self.finished + self.failed)
+
+
+class TaskFuture(Future):
+    """
+    The future of a scheduled task. Before the task is dispatched to a pool
+    it waits in the queue of its tid, if the concurrency limit is reached.
+
+    Shared arrays of process and interpreter tasks are received as soon
+    as the task is done, so that no shared memory is leaked if the result
+    is never requested.
+    """
+
+    def __init__(self, scheduler, tid, executor, func, args, kwargs, token):
+
+        Future.__init__(self)
+
+        self.scheduler = scheduler
+        self.tid = tid
+        self.executor = executor
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.token = token
+
+        self.pool_future = None
+        self.dispatched = False
+        self.started = False
+
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+    def cancel(self):
+
+        with self.scheduler.lock:
+            if not self.dispatched:
+                self.scheduler.remove_waiting(self)
+                # receive is never called for tasks, which did not run
+                self.token.unlink()
+                return Future.cancel(self)
+            pool_future = self.pool_future
+
+        if not pool_future.cancel():
+            return False
+
+        return Future.cancel(self)
+
+    def receive(self, pool_future):
+
+        self.end_time = time.time()
+
+        self.token.unlink()
+
+        if pool_future.cancelled():
+            Future.cancel(self)
+            return
+
+        exc = pool_future.exception()
+
+        if exc is not None:
+            self.set_exception(exc)
+            return
+
+        res = pool_future.result()
+
+        if self.executor == "thread":
+            self.set_result(res)
+            return
+
+        try:
+            self.start_time, res = res
+            self.set_result(receive_arrays(res))
+        except Exception as e:
+            self.set_exception(e)
+
+
+class Scheduler:
+    """
+    Runs tasks on thread, process and interpreter pools.
+
+    Tasks are identified by a tid (any hashable). For each tid the
+    number of concurrently running tasks can be limited with set_limit and
+    statistics (queue depth, wait and run times, failures) are recorded.
+    """
+
+    def __init__(self,
+                 thread_workers=32,
+                 process_workers=None,
+                 interpreter_workers=None):
+
+        self.lock = threading.RLock()
+
+        self.workers = {
+            "thread": thread_workers,
+            "process": process_workers,
+            "interpreter": interpreter_workers
+        }
+        self.pools = {}
+
+        self.futures = {}
+        self.tokens = {}
+
+        self.limits = {}
+        self.slots = {}
+        self.waiting = {}
+
+        self.stats = {}
+
+    def get_pool(self, kind):
+
+        with self.lock:
+
+            if kind in self.pools:
+                return self.pools[kind]
+
+            workers = self.workers[kind]
+
+            if kind == "thread":
+                pool = ThreadPoolExecutor(workers)
+            elif kind == "interpreter":
+                if hasattr(concurrent.futures, "InterpreterPoolExecutor"):
+                    pool = concurrent.futures.InterpreterPoolExecutor(workers)
+                else:
+                    print("Warning: interpreter pools require "
+                          + "python >= 3.14, using a process pool instead")
+                    pool = self.get_pool("process")
+            else:
+                # forking a process with running (gui) threads is unsafe
+                methods = multiprocessing.get_all_start_methods()
+                method = "forkserver" if "forkserver" in methods else "spawn"
+                context = multiprocessing.get_context(method)
+                if method == "forkserver":
+                    # the default preload is __main__, which imports imviz
+                    context.set_forkserver_preload(["imviz_worker"])
+                pool = ProcessPoolExecutor(workers, mp_context=context)
+
+            self.pools[kind] = pool
+
+            return pool
+
+    def set_workers(self, kind, count):
+        """
+        Sets the number of workers of the given executor kind.
+        Tasks, which were already dispatched, finish on the old pool.
+        """
+
+        check_executor(kind)
+
+        with self.lock:
+            self.workers[kind] = count
+            old_pool = self.pools.pop(kind, None)
+            # interpreter tasks may run on the process pool as fallback
+            if kind == "process" and self.pools.get("interpreter") is old_pool:
+                self.pools.pop("interpreter")
+            if kind == "interpreter" and self.pools.get("process") is old_pool:
+                old_pool = None
+
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+
+    def set_limit(self, tid, max_running, mode="coalesce"):
+        """
+        Limits the number of concurrently running tasks of the tid.
+        Cancelled tasks count until they actually returned.
+
+        With mode "queue" further tasks wait until a task of the tid has
+        finished. With mode "coalesce" only the newest waiting task is kept.
+        max_running=None removes the limit.
+        """
+
+        if mode not in LIMIT_MODES:
+            raise ValueError(f"Unknown limit mode \"{mode}\", "
+                             + f"expected one of {LIMIT_MODES}")
+
+        with self.lock:
+            if max_running is None:
+                self.limits.pop(tid, None)
+            else:
+                self.limits[tid] = (max(1, max_running), mode)
+
+        self.dispatch_waiting(tid)
+
+    def get_stats(self):
+        """
+        Returns a copy of the statistics (tid -> TaskStats).
+        """
+
+        with self.lock:
+            res = {}
+            for tid, st in self.stats.items():
+                res[tid] = TaskStats()
+                res[tid].__dict__.update(st.__dict__)
+            return res
+
+    def reset_stats(self):
+
+        with self.lock:
+            for tid, st in self.stats.items():
+                new_st = TaskStats()
+                new_st.waiting = st.waiting
+                new_st.running = st.running
+                self.stats[tid] = new_st
+
+    def submit(self, tid, func, args, kwargs, executor="thread"):
+        """
+        Schedules func(*args, **kwargs) and returns its TaskFuture.
+        If func accepts a "cancel_token" argument, a Token is passed.
+        """
+
+        check_executor(executor)
+
+        if TOKEN_PARAMETER in kwargs:
+            raise ValueError(f"\"{TOKEN_PARAMETER}\" is reserved for the "
+                             + "Token passed by the scheduler")
+
+        if accepts_token(func):
+            if executor == "thread":
+                token = Token()
+            else:
+                token = SharedToken()
+            kwargs[TOKEN_PARAMETER] = token
+        else:
+            token = Token()
+
+        future = TaskFuture(
+                self, tid, executor, func, args, kwargs, token)
+        future.add_done_callback(self.task_done)
+
+        superseded = []
+
+        with self.lock:
+
+            try:
+                st = self.stats[tid]
+            except KeyError:
+                st = TaskStats()
+                self.stats[tid] = st
+
+            st.submitted += 1
+            st.waiting += 1
+
+            limit = self.limits.get(tid)
+
+            if limit is None or self.slots.get(tid, 0) < limit[0]:
+                self.dispatch(future)
+            else:
+                waiting = self.waiting.setdefault(tid, deque())
+                if limit[1] == "coalesce":
+                    superseded = list(waiting)
+                    waiting.clear()
+                waiting.append(future)
+
+        for f in superseded:
+            f.token.cancel()
+            f.cancel()
+
+        return future
+
+    def dispatch(self, future):
+
+        with self.lock:
+
+            future.dispatched = True
+            self.slots[future.tid] = self.slots.get(future.tid, 0) + 1
+
+            pool = self.get_pool(future.executor)
+
+            if future.executor == "thread":
+                future.pool_future = pool.submit(self.run, future)
+            else:
+                # the start of process tasks is not observable,
+                # so they are counted as running from now on
+                self.task_started(future)
+                future.pool_future = pool.submit(
+                        run_shared, future.func, future.args, future.kwargs)
+
+            future.pool_future.add_done_callback(future.receive)
+
+    def dispatch_waiting(self, tid):
+
+        with self.lock:
+
+            waiting = self.waiting.get(tid)
+            limit = self.limits.get(tid)
+
+            while waiting:
+                if limit is not None and self.slots.get(tid, 0) >= limit[0]:
+                    break
+                self.dispatch(waiting.popleft())
+
+    def remove_waiting(self, future):
+
+        with self.lock:
+            try:
+                self.waiting[future.tid].remove(future)
+            except (KeyError, ValueError):
+                pass
+
+    def run(self, future):
+
+        future.start_time = time.time()
+
+        with self.lock:
+            self.task_started(future)
+
+        return future.func(*future.args, **future.kwargs)
+
+    def task_started(self, future):
+
+        future.started = True
+
+        st = self.stats[future.tid]
+        st.waiting -= 1
+        st.running += 1
+
+    def task_done(self, future):
+
+        with self.lock:
+
+            st = self.stats[future.tid]
+
+            if future.started:
+                st.running -= 1
+            else:
+                st.waiting -= 1
+
+            if future.cancelled():
+                st.cancelled += 1
+            elif isinstance(future.exception(), TaskCancelled):
+                st.cancelled += 1
+            else:
+                if future.exception() is not None:
+                    st.failed += 1
+                else:
+                    st.finished += 1
+
+                end_time = future.end_time
+                start_time = future.start_time
+                if start_time is None:
+                    start_time = end_time
+
+                st.last_wait_time = start_time - future.submit_time
+                st.last_run_time = end_time - start_time
+                st.wait_time += st.last_wait_time
+                st.run_time += st.last_run_time
+                st.max_wait_time = max(st.max_wait_time, st.last_wait_time)
+                st.max_run_time = max(st.max_run_time, st.last_run_time)
+
+            if future.dispatched:
+                self.slots[future.tid] -= 1
+
+        if future.dispatched:
+            self.dispatch_waiting(future.tid)
+
+    def start(self, tid, func, *args, executor="thread", **kwargs):
+
+        with self.lock:
+            self.cancel(tid)
+            future = self.submit(tid, func, args, kwargs, executor)
+            self.futures[tid] = future
+            self.tokens[tid] = future.token
+
+    def update(self, tid, func, *args, executor="thread", **kwargs):
+
+        with self.lock:
+            if self.futures.get(tid) is None:
+                future = self.submit(tid, func, args, kwargs, executor)
+                self.futures[tid] = future
+                self.tokens[tid] = future.token
+
+    def result(self, tid):
+
+        with self.lock:
+
+            task_future = self.futures.get(tid)
+
+            if task_future is None:
+                return None
+            if not task_future.done():
+                return None
+
+            self.futures[tid] = None
+            self.tokens.pop(tid, None)
+
+        if task_future.cancelled():
+            return None
+
+        try:
+            return task_future.result()
+        except TaskCancelled:
+            return None
+
+    def cancel(self, tid):
+
+        with self.lock:
+            task_future = self.futures.get(tid)
+            self.futures[tid] = None
+            token = self.tokens.pop(tid, None)
+
+        if token is not None:
+            token.cancel()
         if task_future is not None:
             task_future.cancel()
-    except KeyError:
-        pass
 
-    TASK_FUTURES[tid] = THREAD_POOL.submit(func, *args, **kwargs)
+    def active(self, tid):
+
+        task_future = self.futures.get(tid)
+
+        if task_future is None:
+            return False
+
+        return not task_future.done()
+
+    def progress(self, tid):
+
+        token = self.tokens.get(tid)
+
+        if token is None:
+            return None
+
+        return token.progress()
+
+
+def check_executor(kind):
+
+    if kind not in EXECUTOR_KINDS:
+        raise ValueError(f"Unknown executor kind \"{kind}\", "
+                         + f"expected one of {EXECUTOR_KINDS}")
+
+
+SCHEDULER = Scheduler()
+"""
+The scheduler, which is used by the module level functions.
+"""
+
+
+def start(tid, func, *args, executor="thread", **kwargs):
+    """
+    This calls the given function in a background thread.
+    Multiple calls with the same tid will cancel already running tasks.
+    Only the result of the newest task is returned by result(tid).
+
+    If func accepts a "cancel_token" argument, a Token is passed, which
+    allows cooperative cancellation and progress reporting.
+
+    The executor kind can be "thread", "process" or "interpreter".
+    """
 
+    SCHEDULER.start(tid, func, *args, executor=executor, **kwargs)
 
-def update(tid, func, *args, **kwargs):
+
+def update(tid, func, *args, executor="thread", **kwargs):
     """
     This calls the given function in a background thread.
     Multiple calls with the same tid will not queue tasks.
 
     If the task is currently running, no new task will be started,
     nor will the running task be interrupted.
-    """
 
-    try:
-        task_future = TASK_FUTURES[tid]
-    except KeyError:
-        task_future = None
+    The executor kind can be "thread", "process" or "interpreter".
+    """
 
-    if task_future is None:
-        TASK_FUTURES[tid] = THREAD_POOL.submit(func, *args, **kwargs)
+    SCHEDULER.update(tid, func, *args, executor=executor, **kwargs)
 
 
 def result(tid):
@@ -45,36 +548,97 @@ def result(tid):
     Returns None if no task result is present.
     """
 
-    try:
-        task_future = TASK_FUTURES[tid]
-        if task_future is None:
-            return None
-        if not task_future.done():
-            return None
-
-        TASK_FUTURES[tid] = None
-        return task_future.result()
-    except KeyError:
-        return None
+    return SCHEDULER.result(tid)
 
 
 def cancel(tid):
+    """
+    Cancels the task. Running tasks are notified through their token.
+    Their result is dropped, even if they do not check for cancellation.
+    """
 
-    try:
-        task_future = TASK_FUTURES[tid]
-        task_future.cancel()
-        TASK_FUTURES[tid] = None
-    except KeyError:
-        pass
+    SCHEDULER.cancel(tid)
 
 
 def active(tid):
 
-    try:
-        task_future = TASK_FUTURES[tid]
-        if task_future is None:
-            return False
-        else:
-            return not task_future.done()
-    except KeyError:
-        return False
+    return SCHEDULER.active(tid)
+
+
+def progress(tid):
+    """
+    Returns the last progress reported by the task (see Token),
+    or None if the task is inactive.
+    """
+
+    return SCHEDULER.progress(tid)
+
+
+def set_workers(kind, count):
+
+    SCHEDULER.set_workers(kind, count)
+
+
+def set_limit(tid, max_running, mode="coalesce"):
+
+    SCHEDULER.set_limit(tid, max_running, mode)
+
+
+def stats():
+
+    return SCHEDULER.get_stats()
+
+
+def stats_window(name="Tasks", scheduler=None):
+    """
+    Shows the task statistics of the scheduler in an imviz window.
+    """
+
+    if scheduler is None:
+        scheduler = SCHEDULER
+
+    if viz.begin_window(name):
+
+        task_stats = scheduler.get_stats()
+
+        waiting = sum(st.waiting for st in task_stats.values())
+        running = sum(st.running for st in task_stats.values())
+
+        viz.text(f"{waiting} waiting, {running} running")
+        viz.same_line()
+        if viz.button("Reset"):
+            scheduler.reset_stats()
+
+        columns = ["tid", "waiting", "running", "finished", "failed",
+                   "cancelled", "wait [ms]", "run [ms]", "max wait [ms]",
+                   "max run [ms]"]
+
+        if viz.begin_table("task_stats",
+                           len(columns),
+                           viz.TableFlags.BORDERS
+                           | viz.TableFlags.ROWBG
+                           | viz.TableFlags.RESIZABLE):
+
+            for c in columns:
+                viz.table_setup_column(c)
+            viz.table_headers_row()
+
+            for tid, st in task_stats.items():
+                values = [st.waiting,
+                          st.running,
+                          st.finished,
+                          st.failed,
+                          st.cancelled,
+                          f"{st.mean_wait_time() * 1000:.1f}",
+                          f"{st.mean_run_time() * 1000:.1f}",
+                          f"{st.max_wait_time * 1000:.1f}",
+                          f"{st.max_run_time * 1000:.1f}"]
+                viz.table_next_column()
+                viz.text(str(tid))
+                for v in values:
+                    viz.table_next_column()
+                    viz.text(str(v))
+
+            viz.end_table()
+
+    viz.end_window()
@@ -0,0 +1,191 @@
+"""
+The parts of imviz.task, which run in process and interpreter workers.
+
+Workers unpickle the functions they call by importing their modules.
+Importing anything from the imviz package imports cppimviz, which creates
+the main window, so this is a top-level module, which only depends on the
+standard library and numpy. It must never import imviz or cppimviz.
+
+Workers still import the module of the task function and the main module
+(see the multiprocessing documentation), so these should only import
+imviz inside functions or below an 'if __name__ == "__main__"' guard.
+"""
+
+import time
+import struct
+
+import numpy as np
+
+from multiprocessing.shared_memory import SharedMemory
+
+
+SHARED_MEMORY_MIN_BYTES = 2**20
+"""
+Arrays of at least this size are returned from process and interpreter
+tasks through shared memory instead of being pickled.
+"""
+
+
+class SharedArray:
+    """
+    Describes an array, which was written to shared memory by a task.
+    """
+
+    def __init__(self, name, shape, dtype):
+
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def share_arrays(obj):
+    """
+    Moves large arrays in obj (or obj itself) to shared memory.
+    """
+
+    if isinstance(obj, np.ndarray):
+        if obj.nbytes < SHARED_MEMORY_MIN_BYTES or obj.dtype.hasobject:
+            return obj
+        try:
+            shm = SharedMemory(create=True, size=obj.nbytes)
+        except OSError:
+            # e.g. /dev/shm is too small, fall back to pickling
+            return obj
+        np.ndarray(obj.shape, obj.dtype, buffer=shm.buf)[...] = obj
+        shared = SharedArray(shm.name, obj.shape, obj.dtype.str)
+        shm.close()
+        return shared
+
+    if type(obj) in (list, tuple):
+        return type(obj)(share_arrays(v) for v in obj)
+    if type(obj) == dict:
+        return {k: share_arrays(v) for k, v in obj.items()}
+
+    return obj
+
+
+def receive_arrays(obj):
+    """
+    Copies shared arrays in obj back into regular arrays
+    and releases the shared memory.
+    """
+
+    if isinstance(obj, SharedArray):
+        shm = SharedMemory(name=obj.name)
+        try:
+            arr = np.ndarray(obj.shape, obj.dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        return arr
+
+    if type(obj) in (list, tuple):
+        return type(obj)(receive_arrays(v) for v in obj)
+    if type(obj) == dict:
+        return {k: receive_arrays(v) for k, v in obj.items()}
+
+    return obj
+
+
+class TaskCancelled(Exception):
+    """
+    Raised by Token.check in tasks, which were cancelled.
+    """
+
+    pass
+
+
+class Token:
+    """
+    Is passed to task functions, which accept a "cancel_token" argument.
+
+    Running tasks are not interrupted. Instead they should regularly call
+    token.check(), which raises TaskCancelled if the task was cancelled.
+    Progress reported with token.set_progress can be read each frame
+    with task.progress(tid).
+    """
+
+    def __init__(self):
+
+        self.values = [0.0, 0.0]
+
+    def cancel(self):
+
+        self.values[0] = 1.0
+
+    def cancelled(self):
+
+        return self.values[0] != 0.0
+
+    def check(self):
+
+        if self.cancelled():
+            raise TaskCancelled()
+
+    def set_progress(self, progress):
+
+        self.values[1] = float(progress)
+
+    def progress(self):
+
+        return self.values[1]
+
+    def unlink(self):
+
+        pass
+
+
+class SharedToken(Token):
+    """
+    A token for process and interpreter tasks, which keeps the cancel flag
+    and the progress in shared memory. Single aligned doubles are written
+    and read, so no locking is needed.
+    """
+
+    def __init__(self, name=None):
+
+        if name is None:
+            self.shm = SharedMemory(create=True, size=16)
+            self.shm.buf[:16] = bytes(16)
+        else:
+            self.shm = SharedMemory(name=name)
+
+        self.unlinked = False
+
+    def __reduce__(self):
+
+        return (SharedToken, (self.shm.name,))
+
+    def cancel(self):
+
+        struct.pack_into("d", self.shm.buf, 0, 1.0)
+
+    def cancelled(self):
+
+        return struct.unpack_from("d", self.shm.buf, 0)[0] != 0.0
+
+    def set_progress(self, progress):
+
+        struct.pack_into("d", self.shm.buf, 8, float(progress))
+
+    def progress(self):
+
+        return struct.unpack_from("d", self.shm.buf, 8)[0]
+
+    def unlink(self):
+
+        # the memory stays mapped (and readable) until the token is deleted
+        if not self.unlinked:
+            self.unlinked = True
+            self.shm.unlink()
+
+
+def run_shared(func, args, kwargs):
+    """
+    Runs func in a process or interpreter worker.
+    Returns the start time and the result.
+    """
+
+    start_time = time.time()
+
+    return start_time, share_arrays(func(*args, **kwargs))
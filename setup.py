@@ -107,6 +107,7 @@ setup(name="imviz",
       long_description_content_type="text/markdown",
       python_requires=">=3.6",
       packages=find_packages(),
+      py_modules=["imviz_worker"],
       ext_modules=[CMakeExtension("cppimviz")],
       cmdclass=dict(build_ext=CMakeBuild),
       include_package_data=True,
@@ -1,5 +1,10 @@
 #include "binding_helpers.hpp"
 
+#include <cctype>
+#include <unordered_map>
+
+#include "misc/cpp/imgui_stdlib.h"
+
 std::string shapeToStr(py::array& array) {
 
     std::stringstream ss;
@@ -165,6 +170,32 @@ GLuint uploadImage(std::string id, ImageInfo& i, py::array& image) {
     return textureId;
 }
 
+ImGuiDataType interpretDataType(const py::dtype& dtype) {
+
+    char kind = dtype.kind();
+    ssize_t size = dtype.itemsize();
+
+    if (kind == 'f') {
+        if (size == 4) { return ImGuiDataType_Float; }
+        if (size == 8) { return ImGuiDataType_Double; }
+    } else if (kind == 'i') {
+        if (size == 1) { return ImGuiDataType_S8; }
+        if (size == 2) { return ImGuiDataType_S16; }
+        if (size == 4) { return ImGuiDataType_S32; }
+        if (size == 8) { return ImGuiDataType_S64; }
+    } else if (kind == 'u') {
+        if (size == 1) { return ImGuiDataType_U8; }
+        if (size == 2) { return ImGuiDataType_U16; }
+        if (size == 4) { return ImGuiDataType_U32; }
+        if (size == 8) { return ImGuiDataType_U64; }
+    }
+
+    throw std::runtime_error(
+            "Data type "
+            + std::string(py::str(dtype))
+            + " cannot be interpreted");
+}
+
 PlotArrayInfo interpretPlotArrays(
         array_like<double>& x,
         array_like<double>& y) {
@@ -208,3 +239,160 @@ PlotArrayInfo interpretPlotArrays(
 
     return info;
 }
+
+/**
+ * The search state of an open option list.
+ */
+struct OptionSearch {
+
+    std::string search;
+
+    // the search, which indices were computed for
+    std::string filtered;
+    std::vector<int> indices;
+
+    // only used to detect changed labels, never dereferenced
+    const void* labels = nullptr;
+    size_t count = 0;
+    size_t fingerprint = 0;
+};
+
+static std::unordered_map<ImGuiID, OptionSearch> optionSearches;
+
+static std::string toLower(std::string str) {
+
+    for (char& c : str) {
+        c = std::tolower((unsigned char)c);
+    }
+
+    return str;
+}
+
+std::string optionLabel(py::sequence& labels, size_t index) {
+
+    return py::str(labels[index]);
+}
+
+/**
+ * Combines the hashes of the labels, which are cached by python strings,
+ * to detect lists modified in place. Much cheaper than searching again.
+ */
+static size_t labelsFingerprint(py::sequence& labels, size_t count) {
+
+    py::object items = py::reinterpret_steal<py::object>(
+            PySequence_Fast(labels.ptr(), "labels must be a sequence"));
+
+    if (!items) {
+        throw py::error_already_set();
+    }
+
+    PyObject** ptrs = PySequence_Fast_ITEMS(items.ptr());
+    size_t size = std::min<size_t>(
+            count, PySequence_Fast_GET_SIZE(items.ptr()));
+
+    size_t fingerprint = size;
+
+    for (size_t i = 0; i < size; ++i) {
+
+        Py_hash_t h = PyObject_Hash(ptrs[i]);
+
+        if (h == -1) {
+            // unhashable labels are identified by their address
+            PyErr_Clear();
+            h = (Py_hash_t)ptrs[i];
+        }
+
+        fingerprint = fingerprint * 1000003 ^ (size_t)h;
+    }
+
+    return fingerprint;
+}
+
+/**
+ * Renders a search field for option lists with many items. Returns the
+ * indices of the matching labels or nullptr if all labels are shown.
+ * Typing more characters only searches within the previous matches.
+ */
+const std::vector<int>* searchOptions(ImGuiID id,
+                                      py::sequence& labels,
+                                      size_t count) {
+
+    if (count < OPTION_SEARCH_MIN_ITEMS) {
+        return nullptr;
+    }
+
+    OptionSearch& s = optionSearches[id];
+
+    if (ImGui::IsWindowAppearing()) {
+        ImGui::SetKeyboardFocusHere();
+    }
+
+    ImGui::SetNextItemWidth(-FLT_MIN);
+    ImGui::InputTextWithHint("##search", "search", &s.search);
+
+    if (s.search.empty()) {
+        return nullptr;
+    }
+
+    size_t fingerprint = labelsFingerprint(labels, count);
+
+    bool sameLabels = s.labels == labels.ptr()
+        && s.count == count
+        && s.fingerprint == fingerprint;
+
+    if (sameLabels && s.search == s.filtered) {
+        return &s.indices;
+    }
+
+    std::string needle = toLower(s.search);
+
+    std::vector<int> indices;
+
+    if (sameLabels
+            && !s.filtered.empty()
+            && needle.find(toLower(s.filtered)) != std::string::npos) {
+        // matches of the new search are a subset of the previous ones
+        for (int i : s.indices) {
+            if (toLower(optionLabel(labels, i)).find(needle)
+                    != std::string::npos) {
+                indices.push_back(i);
+            }
+        }
+    } else {
+        for (size_t i = 0; i < count; ++i) {
+            if (toLower(optionLabel(labels, i)).find(needle)
+                    != std::string::npos) {
+                indices.push_back(i);
+            }
+        }
+    }
+
+    s.indices = std::move(indices);
+    s.filtered = s.search;
+    s.labels = labels.ptr();
+    s.count = count;
+    s.fingerprint = fingerprint;
+
+    return &s.indices;
+}
+
+void clearOptionSearch(ImGuiID id) {
+
+    optionSearches.erase(id);
+}
+
+/**
+ * Begins a scrollable child window for count options of one line each.
+ * Must be followed by ImGui::EndChild().
+ */
+bool beginOptionList(size_t count) {
+
+    float lineHeight = ImGui::GetTextLineHeightWithSpacing();
+    float height = std::min<size_t>(std::max<size_t>(count, 1), 12)
+        * lineHeight + ImGui::GetStyle().WindowPadding.y;
+
+    float width = std::max(ImGui::GetContentRegionAvail().x,
+                           ImGui::GetFontSize() * 12.0f);
+
+    return ImGui::BeginChild("##options", ImVec2(width, height));
+}
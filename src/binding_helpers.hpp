@@ -66,6 +66,24 @@ ImageInfo interpretImage(py::array& image);
 
 GLuint uploadImage(std::string id, ImageInfo& i, py::array& image);
 
+ImGuiDataType interpretDataType(const py::dtype& dtype);
+
+/**
+ * Helpers for widgets with large option lists.
+ */
+
+const size_t OPTION_SEARCH_MIN_ITEMS = 16;
+
+const std::vector<int>* searchOptions(ImGuiID id,
+                                      py::sequence& labels,
+                                      size_t count);
+
+void clearOptionSearch(ImGuiID id);
+
+std::string optionLabel(py::sequence& labels, size_t index);
+
+bool beginOptionList(size_t count);
+
 struct PlotArrayInfo {
 
     std::vector<double> indices;
@@ -3,6 +3,7 @@
 #include <pybind11/cast.h>
 #include <pybind11/numpy.h>
 #include <pybind11/pytypes.h>
+#include <cstring>
 #include <stdexcept>
 
 #include <GL/glew.h>
@@ -19,6 +20,8 @@
 #include "bindings_implot.hpp"
 #include "bindings_imgui.hpp"
 #include "load_image.hpp"
+
+#include "misc/cpp/imgui_stdlib.h"
 // #include "shader_program.hpp"
 
 /**
@@ -35,6 +38,75 @@ namespace py = pybind11;
 
 ImViz viz;
 
+/**
+ * Renders and presents the current frame. Returns false if rendering
+ * failed and the imgui context was recreated, in which case events should
+ * not be processed before the next frame is prepared.
+ */
+bool presentFrame(bool vsync) {
+
+    resetDragDrop();
+
+    py::gil_scoped_release release;
+
+    try {
+        viz.doUpdate(vsync);
+    } catch (std::runtime_error& e) { 
+        // last resort: if we catch an error here soft recovery failed
+        // recreate the context from scratch and hope for the best
+
+        std::cerr << e.what() << std::endl;
+
+        viz.setupImLibs();
+
+        // reconfigure and load ini
+        ImGuiIO& io = ImGui::GetIO();
+        io.IniFilename = viz.iniFilePath.c_str();
+        ImGui::LoadIniSettingsFromDisk(io.IniFilename);
+
+        return false;
+    }
+
+    input::update();
+
+    return true;
+}
+
+/**
+ * Formats a single number of the given numpy dtype kind and size.
+ */
+void formatNumber(char* buf, size_t size, char kind, ssize_t itemSize,
+                  const char* ptr) {
+
+    if (kind == 'b') {
+        snprintf(buf, size, "%s", *(const bool*)ptr ? "True" : "False");
+    } else if (kind == 'f' && itemSize == 4) {
+        float v;
+        std::memcpy(&v, ptr, sizeof(v));
+        snprintf(buf, size, "%g", v);
+    } else if (kind == 'f' && itemSize == 8) {
+        double v;
+        std::memcpy(&v, ptr, sizeof(v));
+        snprintf(buf, size, "%g", v);
+    } else if (kind == 'i') {
+        long long v = 0;
+        if (itemSize == 1) { v = *(const int8_t*)ptr; }
+        if (itemSize == 2) { int16_t x; std::memcpy(&x, ptr, 2); v = x; }
+        if (itemSize == 4) { int32_t x; std::memcpy(&x, ptr, 4); v = x; }
+        if (itemSize == 8) { int64_t x; std::memcpy(&x, ptr, 8); v = x; }
+        snprintf(buf, size, "%lld", v);
+    } else if (kind == 'u') {
+        unsigned long long v = 0;
+        if (itemSize == 1) { v = *(const uint8_t*)ptr; }
+        if (itemSize == 2) { uint16_t x; std::memcpy(&x, ptr, 2); v = x; }
+        if (itemSize == 4) { uint32_t x; std::memcpy(&x, ptr, 4); v = x; }
+        if (itemSize == 8) { uint64_t x; std::memcpy(&x, ptr, 8); v = x; }
+        snprintf(buf, size, "%llu", v);
+    } else {
+        snprintf(buf, size, "?");
+    }
+}
+
 PYBIND11_MODULE(cppimviz, m) {
 
     /**
@@ -155,33 +227,73 @@ PYBIND11_MODULE(cppimviz, m) {
 
     m.def("multiselect", [&](
                 std::string label,
-                py::list& values,
-                py::list selection) {
+                py::sequence values,
+                py::object selection,
+                py::object labels) {
+
+        // sets are the fastest selections, lists are searched,
+        // only the visible values are checked and converted to strings
+
+        py::sequence labelSeq = labels.is_none()
+            ? values : py::reinterpret_borrow<py::sequence>(labels);
+
+        size_t len = py::len(values);
+
+        if (py::len(labelSeq) != len) {
+            throw std::runtime_error(
+                    "Values and labels must have the same length");
+        }
+
+        bool isSet = py::isinstance<py::set>(selection);
+
+        ImGuiID id = ImGui::GetID(label.c_str());
 
         bool mod = false;
 
         if (ImGui::BeginPopup(label.c_str())) {
 
-            for (py::handle o : values) {
-                std::string ostr = py::str(o);
+            const std::vector<int>* indices = searchOptions(id, labelSeq, len);
+            size_t count = indices != nullptr ? indices->size() : len;
 
-                bool inList = selection.contains(o);
+            if (beginOptionList(count)) {
 
-                // this will be modified by the checkbox
-                bool selected = inList;
+                ImGuiListClipper clipper;
+                clipper.Begin(count);
 
-                if (ImGui::Checkbox(ostr.c_str(), &selected)) {
-                    if (selected && !inList) {
-                        selection.append(o);
-                    } else if (!selected && inList) {
-                        selection.attr("remove")(o);
-                    }
+                while (clipper.Step()) {
+                    for (int k = clipper.DisplayStart; k < clipper.DisplayEnd; ++k) {
+
+                        int i = indices != nullptr ? (*indices)[k] : k;
+
+                        py::object o = values[i];
+                        std::string ostr = optionLabel(labelSeq, i);
+
+                        bool inList = selection.contains(o);
+
+                        // this will be modified by the checkbox
+                        bool selected = inList;
+
+                        ImGui::PushID(i);
 
-                    mod = true;
+                        if (ImGui::Checkbox(ostr.c_str(), &selected)) {
+                            if (selected && !inList) {
+                                selection.attr(isSet ? "add" : "append")(o);
+                            } else if (!selected && inList) {
+                                selection.attr("remove")(o);
+                            }
+
+                            mod = true;
+                        }
+
+                        ImGui::PopID();
+                    }
                 }
             }
+            ImGui::EndChild();
 
             ImGui::EndPopup();
+        } else {
+            clearOptionSearch(id);
         }
 
         if (ImGui::Button(label.c_str())) {
@@ -194,85 +306,363 @@ PYBIND11_MODULE(cppimviz, m) {
     },
     py::arg("label"),
     py::arg("values"),
-    py::arg("selection"));
+    py::arg("selection"),
+    py::arg("labels") = py::none());
 
-    m.def("dataframe", [&](
-                py::object frame,
+    m.def("array_editor", [&](
                 std::string label,
-                py::list selection) {
+                py::array array,
+                float speed,
+                std::string format,
+                float cellWidth,
+                ImVec2 size) {
+
+        assert_shape(array, {{-1}, {-1, -1}});
+
+        if (!array.writeable()) {
+            throw std::runtime_error("Array editor requires a writeable array");
+        }
+
+        if (!array.dtype().attr("isnative").cast<bool>()) {
+            throw std::runtime_error("Array editor requires native byte order");
+        }
+
+        bool isBool = array.dtype().kind() == 'b';
+
+        ImGuiDataType dataType = ImGuiDataType_COUNT;
+        if (!isBool) {
+            dataType = interpretDataType(array.dtype());
+        }
+
+        // edits are written directly into the array memory,
+        // 1d arrays are edited like a single column
+
+        char* data = (char*)array.mutable_data();
+
+        ssize_t ndim = array.ndim();
+        ssize_t rows = array.shape(0);
+        ssize_t cols = ndim == 2 ? array.shape(1) : 1;
+        ssize_t rowStride = array.strides(0);
+        ssize_t colStride = ndim == 2 ? array.strides(1) : 0;
+
+        const char* fmt = format.empty() ? nullptr : format.c_str();
+
+        ImGuiStyle& style = ImGui::GetStyle();
+
+        float rowHeight = ImGui::GetFrameHeightWithSpacing();
+        float indexWidth = ImGui::CalcTextSize(
+                std::to_string(rows).c_str()).x + style.ItemSpacing.x;
+        float cellStride = cellWidth + style.ItemSpacing.x;
+
+        if (size.y <= 0.0f) {
+            size.y = std::min<ssize_t>(rows, 16) * rowHeight
+                + 2.0f * style.WindowPadding.y
+                + style.ScrollbarSize;
+        }
+
+        std::vector<ssize_t> modified;
+
+        if (ImGui::BeginChild(label.c_str(),
+                              size,
+                              true,
+                              ImGuiWindowFlags_HorizontalScrollbar)) {
+
+            // reserve the full width, so that hidden columns can be scrolled to
+
+            ImVec2 start = ImGui::GetCursorPos();
+            ImGui::Dummy(ImVec2(indexWidth + cols * cellStride, 0.0f));
+            ImGui::SetCursorPos(start);
+
+            // only visible columns and rows are drawn
+
+            ssize_t firstCol = std::max<ssize_t>(0, (ssize_t)(
+                        (ImGui::GetScrollX() - indexWidth) / cellStride));
+            ssize_t lastCol = std::min<ssize_t>(cols, firstCol + (ssize_t)(
+                        ImGui::GetWindowWidth() / cellStride) + 2);
+
+            ImGuiListClipper clipper;
+            clipper.Begin((int)rows, rowHeight);
+
+            while (clipper.Step()) {
+                for (int r = clipper.DisplayStart; r < clipper.DisplayEnd; ++r) {
+
+                    ImGui::PushID(r);
+
+                    ImGui::AlignTextToFramePadding();
+                    ImGui::TextDisabled("%d", r);
+
+                    for (ssize_t c = firstCol; c < lastCol; ++c) {
+
+                        ImGui::SameLine(indexWidth + c * cellStride);
+                        ImGui::SetNextItemWidth(cellWidth);
+
+                        ImGui::PushID((int)c);
+
+                        void* ptr = data + r * rowStride + c * colStride;
+
+                        bool changed = false;
+
+                        if (isBool) {
+                            changed = ImGui::Checkbox("##cell", (bool*)ptr);
+                        } else {
+                            changed = ImGui::DragScalar(
+                                    "##cell", dataType, ptr, speed,
+                                    nullptr, nullptr, fmt);
+                        }
+
+                        if (changed) {
+                            modified.push_back(r);
+                            if (ndim == 2) {
+                                modified.push_back(c);
+                            }
+                        }
+
+                        ImGui::PopID();
+                    }
+
+                    ImGui::PopID();
+                }
+            }
+        }
+
+        ImGui::EndChild();
+
+        ssize_t count = modified.size() / ndim;
+
+        py::array_t<ssize_t> indices(std::vector<ssize_t>{count, ndim});
+        std::copy(modified.begin(), modified.end(), indices.mutable_data());
+
+        viz.setMod(count > 0);
+
+        return indices;
+    },
+    py::arg("label"),
+    py::arg("array"),
+    py::arg("speed") = 1.0f,
+    py::arg("format") = "",
+    py::arg("cell_width") = 80.0f,
+    py::arg("size") = ImVec2(0.0f, 0.0f));
+
+    m.def("dataframe_table", [&](
+                std::string label,
+                py::list names,
+                py::list columns,
+                py::list texts,
+                py::array_t<int64_t> rows,
+                py::array selected,
+                py::list filters) {
+
+        size_t colCount = py::len(names);
+
+        if (py::len(columns) != colCount
+                || py::len(texts) != colCount
+                || py::len(filters) != colCount) {
+            throw std::runtime_error(
+                    "Names, columns, texts and filters must have the same length");
+        }
+
+        if (selected.dtype().kind() != 'b' || !selected.writeable()) {
+            throw std::runtime_error(
+                    "Selection mask must be a writeable bool array");
+        }
+
+        // numeric columns are read from their buffers, other columns
+        // are converted to strings once and cached in a dict (row -> str)
+
+        struct DataFrameColumn {
+
+            py::array array;
+            py::object texts;
+            py::object getItem;
+
+            char kind = 0;
+            ssize_t itemSize = 0;
+            const char* data = nullptr;
+            ssize_t stride = 0;
+        };
+
+        std::vector<DataFrameColumn> cols;
+
+        ssize_t n = selected.shape(0);
+
+        for (size_t c = 0; c < colCount; ++c) {
+
+            DataFrameColumn col;
+            col.array = columns[c];
+            col.texts = texts[c];
+
+            if (col.array.ndim() != 1 || col.array.shape(0) != n) {
+                throw std::runtime_error(
+                        "Columns must have the length of the selection mask");
+            }
 
-        py::list keys = frame.attr("keys")();
-        py::function itemFunc = frame.attr("__getitem__");
-        py::array index = frame.attr("index");
-        py::function indexGetFunc = index.attr("__getitem__");
+            if (col.texts.is_none()) {
+                col.kind = col.array.dtype().kind();
+                col.itemSize = col.array.dtype().itemsize();
+                col.data = (const char*)col.array.data();
+                col.stride = col.array.strides(0);
+            } else {
+                col.getItem = col.array.attr("__getitem__");
+            }
+
+            cols.push_back(col);
+        }
+
+        auto rowsView = rows.unchecked<1>();
+        ssize_t rowCount = rowsView.shape(0);
+
+        bool* mask = (bool*)selected.mutable_data();
+        ssize_t maskStride = selected.strides(0);
 
-        size_t columnCount = 2 + py::len(keys);
+        py::list toggled;
+        py::object sortSpecs = py::none();
+        bool filtersChanged = false;
 
         ImGuiTableFlags flags =
             ImGuiTableFlags_Borders
             | ImGuiTableFlags_RowBg
             | ImGuiTableFlags_Resizable
             | ImGuiTableFlags_Reorderable
+            | ImGuiTableFlags_Sortable
+            | ImGuiTableFlags_SortMulti
+            | ImGuiTableFlags_SortTristate
             | ImGuiTableFlags_ScrollX
             | ImGuiTableFlags_ScrollY;
 
-        if (ImGui::BeginTable(label.c_str(), columnCount, flags)) {
+        if (ImGui::BeginTable(label.c_str(), colCount + 1, flags)) {
+
+            // headers and filters stay visible
+
+            ImGui::TableSetupScrollFreeze(1, 2);
+
+            ImGui::TableSetupColumn("", ImGuiTableColumnFlags_NoSort);
+
+            for (const py::handle& o : names) {
+                std::string name = py::str(o);
+                ImGui::TableSetupColumn(name.c_str());
+            }
+
+            ImGui::TableHeadersRow();
 
-            std::vector<py::function> getColDataFuncs;
-            getColDataFuncs.push_back(indexGetFunc);
+            // the sorting itself is done by the caller,
+            // specs are only returned when they changed
 
-            ImGui::TableSetupColumn("");
-            ImGui::TableSetupColumn("index");
+            ImGuiTableSortSpecs* specs = ImGui::TableGetSortSpecs();
 
-            for (const py::handle& o : keys) {
+            if (specs != nullptr && specs->SpecsDirty) {
 
-                std::string key = py::cast<std::string>(o);
+                py::list specList;
 
-                getColDataFuncs.push_back(
-                        itemFunc(key)
-                        .attr("astype")("str")
-                        .attr("__getitem__"));
+                for (int i = 0; i < specs->SpecsCount; ++i) {
+                    const ImGuiTableColumnSortSpecs& spec = specs->Specs[i];
+                    specList.append(py::make_tuple(
+                            spec.ColumnIndex - 1,
+                            spec.SortDirection
+                                == ImGuiSortDirection_Descending));
+                }
 
-                ImGui::TableSetupColumn(key.c_str());
+                sortSpecs = specList;
+                specs->SpecsDirty = false;
             }
 
-            ImGui::TableHeadersRow();
+            ImGui::TableNextRow();
 
-            for (ssize_t r = 0; r < index.size(); ++r) {
-                ImGui::TableNextRow();
+            for (size_t c = 0; c < colCount; ++c) {
 
-                py::object rowIndex = indexGetFunc(r);
-                bool state = selection.contains(rowIndex);
+                ImGui::TableSetColumnIndex(c + 1);
+                ImGui::PushID((int)c);
 
-                ImGui::TableSetColumnIndex(0);
+                std::string filter = py::str(filters[c]);
 
-                ImGui::PushID(r);
-                
-                if (ImGui::Checkbox("###marked", &state)) {
-                    if (state) {
-                        selection.append(rowIndex);
-                    } else if (selection.contains(rowIndex)) {
-                        selection.attr("remove")(rowIndex);
-                    }
+                ImGui::SetNextItemWidth(-FLT_MIN);
+                if (ImGui::InputTextWithHint("##filter", "filter", &filter)) {
+                    filters[c] = filter;
+                    filtersChanged = true;
                 }
 
                 ImGui::PopID();
+            }
+
+            // only the visible rows are formatted
+
+            ImGuiListClipper clipper;
+            clipper.Begin((int)rowCount);
+
+            char buf[64];
+
+            while (clipper.Step()) {
+                for (int i = clipper.DisplayStart; i < clipper.DisplayEnd; ++i) {
+
+                    int64_t r = rowsView(i);
+
+                    if (r < 0 || r >= n) {
+                        throw std::runtime_error("Row index out of range");
+                    }
+
+                    ImGui::TableNextRow();
+                    ImGui::TableSetColumnIndex(0);
+
+                    ImGui::PushID((int)r);
+
+                    bool* state = (bool*)((char*)mask + r * maskStride);
+
+                    if (ImGui::Checkbox("###marked", state)) {
+                        toggled.append(r);
+                    }
+
+                    ImGui::PopID();
+
+                    for (size_t c = 0; c < colCount; ++c) {
+
+                        ImGui::TableSetColumnIndex(c + 1);
+
+                        DataFrameColumn& col = cols[c];
 
-                for (size_t c = 0; c < getColDataFuncs.size(); ++c) {
-                    ImGui::TableSetColumnIndex(c + 1);
-                    std::string txt{py::str(getColDataFuncs[c](r))};
-                    ImGui::Text("%s", txt.c_str());
+                        if (col.texts.is_none()) {
+                            formatNumber(buf, sizeof(buf), col.kind,
+                                         col.itemSize,
+                                         col.data + r * col.stride);
+                            ImGui::TextUnformatted(buf);
+                            continue;
+                        }
+
+                        py::dict cache = col.texts;
+                        py::int_ key(r);
+
+                        py::object text;
+                        if (cache.contains(key)) {
+                            text = cache[key];
+                        } else {
+                            text = py::str(col.getItem(r));
+                            cache[key] = text;
+                        }
+
+                        Py_ssize_t size = 0;
+                        const char* str = PyUnicode_AsUTF8AndSize(
+                                text.ptr(), &size);
+                        if (str == nullptr) {
+                            throw py::error_already_set();
+                        }
+
+                        ImGui::TextUnformatted(str, str + size);
+                    }
                 }
             }
 
             ImGui::EndTable();
         }
 
-        return selection;
+        viz.setMod(py::len(toggled) > 0);
+
+        return py::make_tuple(toggled, sortSpecs, filtersChanged);
     },
-    py::arg("frame"),
-    py::arg("label") = "",
-    py::arg("selection") = py::list{});
+    py::arg("label"),
+    py::arg("names"),
+    py::arg("columns"),
+    py::arg("texts"),
+    py::arg("rows"),
+    py::arg("selected"),
+    py::arg("filters"));
 
     /*
      * Essential custom functions
@@ -314,33 +704,15 @@ PYBIND11_MODULE(cppimviz, m) {
 
     m.def("wait", [&](bool vsync, bool powersave, double timeout) {
 
-        resetDragDrop();
-
-        // release the gil here so that other threads
-        // may do something valueable while we wait 
-        py::gil_scoped_release release;
-
-        try {
-            viz.doUpdate(vsync);
-        } catch (std::runtime_error& e) { 
-            // last resort: if we catch an error here soft recovery failed
-            // recreate the context from scratch and hope for the best
-
-            std::cerr << e.what() << std::endl;
-
-            viz.setupImLibs();
-
-            // reconfigure and load ini
-            ImGuiIO& io = ImGui::GetIO();
-            io.IniFilename = viz.iniFilePath.c_str();
-            ImGui::LoadIniSettingsFromDisk(io.IniFilename);
-
+        if (!presentFrame(vsync)) {
+            py::gil_scoped_release release;
             viz.prepareUpdate();
-
             return !glfwWindowShouldClose(viz.window);
         }
 
-        input::update();
+        // release the gil here so that other threads
+        // may do something valueable while we wait 
+        py::gil_scoped_release release;
 
         if (powersave) {
             if (viz.powerSaveFrameCounter > 0) {
@@ -361,6 +733,41 @@ PYBIND11_MODULE(cppimviz, m) {
     py::arg("powersave") = false,
     py::arg("timeout") = 1.0);
 
+    /*
+     * The steps of wait, so that the waiting for events
+     * can be done by other event loops (e.g. asyncio).
+     */
+
+    m.def("present", [&](bool vsync) {
+
+        return presentFrame(vsync);
+    },
+    py::arg("vsync") = true);
+
+    m.def("wait_events", [&](double timeout) {
+
+        py::gil_scoped_release release;
+
+        if (timeout > 0.0) {
+            glfwWaitEventsTimeout(timeout);
+        } else {
+            glfwPollEvents();
+        }
+
+        // true if a frame was requested or input is waiting for one
+        bool triggered = viz.triggered.exchange(false);
+        return triggered || ImGui::GetCurrentContext()->InputEventsQueue.Size > 0;
+    },
+    py::arg("timeout") = 0.0);
+
+    m.def("begin_frame", [&]() {
+
+        py::gil_scoped_release release;
+
+        viz.prepareUpdate();
+        return !glfwWindowShouldClose(viz.window);
+    });
+
     /**
      * Image loading
      */
@@ -320,21 +320,67 @@ void loadImguiPythonBindings(pybind11::module& m, ImViz& viz) {
     },
     py::arg("label"));
 
-    m.def("combo", [&](std::string label, py::list items, int selectionIndex) {
+    m.def("combo", [&](std::string label, py::sequence items, int selectionIndex) {
 
-        size_t len = items.size();
+        // only the visible items are converted to strings
 
-        std::vector<std::string> objStr(len);
-        std::vector<const char*> objPtr(len);
+        size_t len = py::len(items);
 
-        int i = 0;
-        for (const py::handle& o : items) {
-            objStr[i] = py::str(o);
-            objPtr[i] = objStr[i].c_str();
-            i += 1;
+        std::string preview;
+        if (selectionIndex >= 0 && (size_t)selectionIndex < len) {
+            preview = optionLabel(items, selectionIndex);
+        }
+
+        ImGuiID id = ImGui::GetID(label.c_str());
+
+        bool mod = false;
+
+        if (ImGui::BeginCombo(label.c_str(),
+                              preview.c_str(),
+                              ImGuiComboFlags_HeightLarge)) {
+
+            const std::vector<int>* indices = searchOptions(id, items, len);
+            size_t count = indices != nullptr ? indices->size() : len;
+
+            bool appearing = ImGui::IsWindowAppearing();
+
+            if (beginOptionList(count)) {
+
+                if (appearing && indices == nullptr && selectionIndex > 0) {
+                    ImGui::SetScrollY(selectionIndex
+                            * ImGui::GetTextLineHeightWithSpacing());
+                }
+
+                ImGuiListClipper clipper;
+                clipper.Begin(count);
+
+                while (clipper.Step()) {
+                    for (int k = clipper.DisplayStart; k < clipper.DisplayEnd; ++k) {
+
+                        int i = indices != nullptr ? (*indices)[k] : k;
+
+                        std::string text = optionLabel(items, i);
+
+                        ImGui::PushID(i);
+                        if (ImGui::Selectable(text.c_str(), i == selectionIndex)) {
+                            selectionIndex = i;
+                            mod = true;
+                        }
+                        ImGui::PopID();
+                    }
+                }
+            }
+            ImGui::EndChild();
+
+            if (mod) {
+                ImGui::CloseCurrentPopup();
+            }
+
+            ImGui::EndCombo();
+        } else {
+            clearOptionSearch(id);
         }
 
-        bool mod = ImGui::Combo(label.c_str(), &selectionIndex, objPtr.data(), len);
         viz.setMod(mod);
 
         return selectionIndex;
@@ -629,6 +675,22 @@ void loadImguiPythonBindings(pybind11::module& m, ImViz& viz) {
 
     m.def("table_headers_row", &ImGui::TableHeadersRow);
 
+    /**
+     * List clipping
+     */
+
+    py::class_<ImGuiListClipper>(m, "ListClipper")
+        .def(py::init<>())
+        .def("begin", &ImGuiListClipper::Begin,
+        py::arg("items_count"),
+        py::arg("items_height") = -1.0f)
+        .def("end", &ImGuiListClipper::End)
+        .def("step", &ImGuiListClipper::Step)
+        .def_readonly("display_start", &ImGuiListClipper::DisplayStart)
+        .def_readonly("display_end", &ImGuiListClipper::DisplayEnd)
+        .def_readonly("items_count", &ImGuiListClipper::ItemsCount)
+        .def_readonly("items_height", &ImGuiListClipper::ItemsHeight);
+
     /**
      * Imgui style functions
      */
@@ -1,13 +1,240 @@
 #include "file_dialog.hpp"
 
+#include <map>
+#include <deque>
+#include <mutex>
+#include <atomic>
+#include <chrono>
+#include <memory>
+#include <thread>
 #include <vector>
+#include <condition_variable>
 #include <algorithm>
 #include <filesystem>
 
+#include <GLFW/glfw3.h>
+
 #include "imgui.h"
 
 namespace fs = std::filesystem;
 
+/**
+ * Directory listings are cached per path and updated on a worker thread,
+ * because listing large directories (or network mounts) can take long.
+ * The worker is joined on shutdown, so it never outlives the ui.
+ */
+namespace {
+
+    const auto LISTING_CHECK_INTERVAL = std::chrono::seconds(1);
+    const size_t MAX_CACHED_LISTINGS = 64;
+
+    struct DirEntry {
+
+        fs::path path;
+        std::string name;
+        bool isDir = false;
+    };
+
+    struct DirListing {
+
+        std::mutex mutex;
+
+        // replaced as a whole by the worker, so it can be rendered unlocked
+        std::shared_ptr<const std::vector<DirEntry>> entries;
+        std::string error;
+
+        bool loaded = false;
+        bool updating = false;
+
+        fs::file_time_type mtime;
+        std::chrono::steady_clock::time_point checked;
+    };
+
+    void updateListing(std::shared_ptr<DirListing> listing,
+                       const fs::path& path,
+                       const std::atomic<bool>& shutdown) {
+
+        // the listing is only read again if the directory was modified
+
+        std::error_code ec;
+        fs::file_time_type mtime = fs::last_write_time(path, ec);
+
+        {
+            std::lock_guard<std::mutex> lock(listing->mutex);
+            if (!ec && listing->loaded && mtime == listing->mtime) {
+                listing->updating = false;
+                return;
+            }
+        }
+
+        auto entries = std::make_shared<std::vector<DirEntry>>();
+        std::string error;
+
+        if (ec) {
+            error = ec.message();
+        } else {
+            fs::directory_iterator it(
+                    path, fs::directory_options::skip_permission_denied, ec);
+
+            for (; !ec && it != fs::directory_iterator(); it.increment(ec)) {
+
+                if (shutdown) {
+                    return;
+                }
+
+                DirEntry e;
+                e.path = it->path();
+                e.name = e.path.filename().string();
+
+                if (e.name.empty() || e.name.at(0) == '.') {
+                    continue;
+                }
+
+                // usually known from the directory listing itself
+                std::error_code typeEc;
+                e.isDir = it->is_directory(typeEc);
+
+                entries->push_back(std::move(e));
+            }
+
+            if (ec) {
+                error = ec.message();
+            }
+        }
+
+        // directories are sorted in before files,
+        // both are sorted alphabetically
+
+        std::sort(
+                entries->begin(),
+                entries->end(),
+                [](const DirEntry& a, const DirEntry& b) -> bool {
+                    if (a.isDir != b.isDir) {
+                        return a.isDir;
+                    }
+                    return a.name < b.name;
+                }
+            );
+
+        {
+            std::lock_guard<std::mutex> lock(listing->mutex);
+            listing->entries = entries;
+            listing->error = error;
+            listing->mtime = mtime;
+            listing->loaded = true;
+            listing->updating = false;
+        }
+
+        // redraw, even if the ui waits for events
+        if (!shutdown) {
+            glfwPostEmptyEvent();
+        }
+    }
+
+    struct ListingWorker {
+
+        std::mutex mutex;
+        std::condition_variable wakeup;
+        std::deque<std::pair<std::shared_ptr<DirListing>, fs::path>> queue;
+        std::atomic<bool> shutdown = false;
+
+        // started last, after all other members were initialized
+        std::thread thread;
+
+        ListingWorker() : thread(&ListingWorker::run, this) { }
+
+        ~ListingWorker() {
+
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                shutdown = true;
+            }
+
+            wakeup.notify_one();
+            thread.join();
+        }
+
+        void request(std::shared_ptr<DirListing> listing, const fs::path& path) {
+
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                queue.emplace_back(listing, path);
+            }
+
+            wakeup.notify_one();
+        }
+
+        void run() {
+
+            while (true) {
+
+                std::pair<std::shared_ptr<DirListing>, fs::path> job;
+
+                {
+                    std::unique_lock<std::mutex> lock(mutex);
+                    wakeup.wait(lock, [this] {
+                        return shutdown || !queue.empty();
+                    });
+                    if (shutdown) {
+                        return;
+                    }
+                    job = std::move(queue.front());
+                    queue.pop_front();
+                }
+
+                updateListing(job.first, job.second, shutdown);
+            }
+        }
+    };
+
+    ListingWorker& getWorker() {
+
+        // created on first use, so it is destroyed before the ui
+        static ListingWorker worker;
+
+        return worker;
+    }
+
+    std::shared_ptr<DirListing> getListing(const fs::path& path) {
+
+        static std::map<std::string, std::shared_ptr<DirListing>> listings;
+
+        std::string key = path.string();
+
+        if (listings.size() >= MAX_CACHED_LISTINGS
+                && listings.find(key) == listings.end()) {
+            listings.clear();
+        }
+
+        std::shared_ptr<DirListing>& listing = listings[key];
+
+        if (!listing) {
+            listing = std::make_shared<DirListing>();
+        }
+
+        auto now = std::chrono::steady_clock::now();
+        bool update = false;
+
+        {
+            std::lock_guard<std::mutex> lock(listing->mutex);
+            if (!listing->updating
+                    && (!listing->loaded
+                        || now - listing->checked > LISTING_CHECK_INTERVAL)) {
+                listing->updating = true;
+                listing->checked = now;
+                update = true;
+            }
+        }
+
+        // a listing is only queued again after its update finished
+        if (update) {
+            getWorker().request(listing, path);
+        }
+
+        return listing;
+    }
+}
+
 /**
  * Custom ImGui Extension for handling path selection.
  */
@@ -15,13 +242,24 @@ namespace ImGui {
 
     void PathSelector (std::string& selectedPath) { 
 
+        // avoids a stat of the selected path every frame
+
+        static std::string statPath;
+        static bool statIsDir = false;
+
+        if (statPath != selectedPath) {
+            std::error_code ec;
+            statPath = selectedPath;
+            statIsDir = fs::is_directory(selectedPath, ec);
+        }
+
         ImGui::BeginChild("Dir Listing",
                 ImVec2(500, 400),
                 false,
                 ImGuiWindowFlags_HorizontalScrollbar);
 
         if (ImGui::Selectable("./..", false)) {
-            if (!fs::is_directory(selectedPath) 
+            if (!statIsDir
                     || fs::path(selectedPath).filename().empty()) {
                 selectedPath = fs::path(selectedPath)
                     .parent_path()
@@ -30,57 +268,63 @@ namespace ImGui {
                 selectedPath = fs::path(selectedPath)
                     .parent_path();
             }
+
+            statPath = selectedPath;
+            statIsDir = true;
         }
 
-        // Obtain a list of all entries in the current directory
+        // Obtain the (cached) entries of the current directory
 
         fs::path listPath = selectedPath;
-        if (!fs::is_directory(listPath)) {
+        if (!statIsDir) {
             listPath = listPath.parent_path();
         }
 
-        std::vector<fs::directory_entry> entries;
+        std::shared_ptr<DirListing> listing = getListing(listPath);
 
-        if (fs::exists(listPath)) {
-            for (fs::directory_entry e : fs::directory_iterator(listPath)) {
-                if (std::string(e.path().filename()).at(0) != '.') {
-                    entries.push_back(e);
-                }
-            }
+        std::shared_ptr<const std::vector<DirEntry>> entries;
+        std::string error;
+        bool loaded = false;
+
+        {
+            std::lock_guard<std::mutex> lock(listing->mutex);
+            entries = listing->entries;
+            error = listing->error;
+            loaded = listing->loaded;
         }
 
-        // Because the entries may be sorted arbitrarily
-        // we sort them alphabetically.
-        // Also directories are sorted in before files.
+        if (!loaded) {
+            ImGui::TextDisabled("loading ...");
+        } else if (!error.empty()) {
+            ImGui::TextDisabled("%s", error.c_str());
+        }
 
-        std::sort(
-                entries.begin(),
-                entries.end(),
-                [](auto& a, auto& b) -> bool {
-                    if (fs::is_directory(a) && !fs::is_directory(b)) {
-                        return true;
-                    } else if (!fs::is_directory(a) && fs::is_directory(b)) {
-                        return false;
-                    } else {
-                        return a.path().filename() < b.path().filename();
-                    }
-                }
-            );
+        if (entries) {
 
-        for (fs::directory_entry e : entries) {
+            ImGuiListClipper clipper;
+            clipper.Begin((int)entries->size());
 
-            std::string displayName = e.path().stem();
-            displayName += e.path().extension();
+            while (clipper.Step()) {
+                for (int i = clipper.DisplayStart; i < clipper.DisplayEnd; ++i) {
 
-            if (fs::is_directory(e)) {
-                displayName += "/";
-            }
+                    const DirEntry& e = (*entries)[i];
 
-            if (ImGui::Selectable(
-                        displayName.c_str(),
-                        selectedPath == e.path())) {
+                    std::string displayName = e.name;
 
-                selectedPath = e.path();
+                    if (e.isDir) {
+                        displayName += "/";
+                    }
+
+                    if (ImGui::Selectable(
+                                displayName.c_str(),
+                                selectedPath == e.path)) {
+
+                        selectedPath = e.path;
+
+                        statPath = selectedPath;
+                        statIsDir = e.isDir;
+                    }
+                }
             }
         }
 
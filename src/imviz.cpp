@@ -258,6 +258,7 @@ void ImViz::recover()
 
 void ImViz::trigger () {
 
+    triggered = true;
     glfwPostEmptyEvent();
 }
 
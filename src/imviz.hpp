@@ -1,6 +1,7 @@
 #pragma once
 
 #include <regex>
+#include <atomic>
 
 #include <GL/glew.h>
 #include <GLFW/glfw3.h>
@@ -31,6 +32,9 @@ struct ImViz {
     // initially update for two whole seconds (assuming vsync)
     int powerSaveFrameCounter = 120;
 
+    // set by trigger (from any thread), reset by wait_events
+    std::atomic<bool> triggered = false;
+
     std::regex re{"(-)?(o|s|d|\\*|\\+)?"};
 
     ImViz();